@@ -3,12 +3,16 @@ Sistema de autenticación y autorización
 """
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
+import time
+import asyncio
+import hashlib
 from dotenv import load_dotenv
+from cache import ResponseCache
 
 load_dotenv()
 
@@ -16,9 +20,23 @@ SECRET_KEY = os.getenv("SECRET_KEY", "tu_clave_secreta_muy_segura")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt se ejecuta en hilos propios: no bloquea el event loop y un
+# ataque de fuerza bruta no puede ocupar más de AUTH_HASH_WORKERS hilos
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "2"))
+AUTH_HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", "8"))
+AUTH_HASH_TIMEOUT = float(os.getenv("AUTH_HASH_TIMEOUT", "5"))
+# Tokens ya verificados (hash del token => claims) hasta su expiración
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+
 security = HTTPBearer()
 
+_hash_executor = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots: Optional[asyncio.Semaphore] = None
+token_cache = ResponseCache(maxsize=TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+# Hash bcrypt precalculado de la contraseña admin (python auth.py <contraseña>)
+ADMIN_PASSWORD_HASH = os.getenv("ADMIN_PASSWORD_HASH")
+
 # Usuarios admin - estructura base
 ADMIN_USERS = {
     "admin@loquieroyacm.com": {
@@ -31,33 +49,77 @@ ADMIN_USERS = {
 
 def init_admin_users():
     """
-    Inicializa usuarios admin con hash de contraseñas
-    Se llama desde el startup de FastAPI
+    Inicializa usuarios admin con el hash precalculado (ADMIN_PASSWORD_HASH)
+    Se llama desde el startup de FastAPI. Sin hash precalculado, el hash
+    se genera en el primer login, no durante el arranque.
     """
-    global ADMIN_USERS
-    try:
-        # Intentar hashear las contraseñas
-        for email, user in ADMIN_USERS.items():
-            if user.get("password_plain") and not user.get("hashed_password"):
-                user["hashed_password"] = pwd_context.hash(user["password_plain"])
-        print("✅ Usuarios admin inicializados con bcrypt")
-    except Exception as e:
-        print(f"⚠️ No se pudo usar bcrypt: {e}")
-        print("ℹ️ Usando comparación simple de contraseñas")
+    if not ADMIN_PASSWORD_HASH:
+        print("ℹ️ ADMIN_PASSWORD_HASH no configurado: el hash se generará en el primer login")
+        return
+    for email, user in ADMIN_USERS.items():
+        user["hashed_password"] = ADMIN_PASSWORD_HASH
+        user["password_plain"] = None
+    print("✅ Usuarios admin inicializados con hash precalculado")
+
+
+@lru_cache(maxsize=None)
+def _pwd_context():
+    # passlib se importa en el primer uso (no en el arranque)
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica contraseña"""
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        return _pwd_context().verify(plain_password, hashed_password)
     except Exception as e:
         print(f"⚠️ Error verificando password con bcrypt: {e}")
         return False
 
 
+async def _run_bcrypt(func, *args):
+    """
+    Ejecuta `func` en el pool de bcrypt. Si hay demasiadas operaciones
+    en espera responde 503 en lugar de encolar sin límite.
+    """
+    global _hash_slots
+    if _hash_slots is None:
+        _hash_slots = asyncio.Semaphore(AUTH_HASH_MAX_PENDING)
+    adquirido = False
+    
+    async def _adquirir():
+        nonlocal adquirido
+        await _hash_slots.acquire()
+        adquirido = True
+    
+    try:
+        try:
+            await asyncio.wait_for(_adquirir(), AUTH_HASH_TIMEOUT)
+        except asyncio.TimeoutError:
+            # En Python < 3.12 el timeout puede llegar justo después de
+            # adquirir el lugar: en ese caso se usa en vez de perderlo
+            if not adquirido:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Demasiados intentos de inicio de sesión, intenta de nuevo en unos segundos",
+                    headers={"Retry-After": "5"}
+                )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+    finally:
+        if adquirido:
+            _hash_slots.release()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verifica contraseña sin bloquear el event loop"""
+    return await _run_bcrypt(verify_password, plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     """Genera hash de contraseña"""
-    return pwd_context.hash(password)
+    return _pwd_context().hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -68,19 +130,30 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def authenticate_user(email: str, password: str):
+async def authenticate_user(email: str, password: str):
     """Autentica usuario"""
     user = ADMIN_USERS.get(email)
     if not user:
         return False
     
+    # Sin hash precalculado se genera en el primer login
+    if not user.get("hashed_password") and user.get("password_plain"):
+        try:
+            user["hashed_password"] = await _run_bcrypt(get_password_hash, user["password_plain"])
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"⚠️ No se pudo usar bcrypt: {e}")
+            print("ℹ️ Usando comparación simple de contraseñas")
+    
     # Intentar verificar con hash bcrypt si existe
     if user.get("hashed_password"):
-        if not verify_password(password, user["hashed_password"]):
+        if not await verify_password_async(password, user["hashed_password"]):
             return False
     # Fallback: comparación simple si no hay hash
     elif user.get("password_plain"):
@@ -92,6 +165,31 @@ def authenticate_user(email: str, password: str):
     return user
 
 
+def verify_token(token: str) -> Optional[dict]:
+    """
+    Retorna los claims de un token válido o None. Los tokens ya
+    verificados se recuerdan (por su hash) hasta que expiran, así las
+    llamadas repetidas no vuelven a verificar la firma.
+    """
+    key = hashlib.sha256(token.encode()).hexdigest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        if payload.get("exp", 0) > time.time():
+            return payload
+        return None
+
+    from jose import JWTError, jwt
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+    exp = payload.get("exp")
+    if exp is not None:
+        token_cache.set(key, payload, ttl=exp - time.time())
+    return payload
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Obtiene usuario actual desde token"""
     credentials_exception = HTTPException(
@@ -99,13 +197,12 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         detail="No se pudo validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    token = credentials.credentials
+    payload = verify_token(token)
+    if payload is None:
+        raise credentials_exception
+    email: Optional[str] = payload.get("sub")
+    if email is None:
         raise credentials_exception
     
     user = ADMIN_USERS.get(email)
@@ -123,3 +220,11 @@ async def require_admin(current_user: dict = Depends(get_current_user)):
         )
     return current_user
 
+
+if __name__ == "__main__":
+    # Genera el valor de ADMIN_PASSWORD_HASH: python auth.py <contraseña>
+    import sys
+    if len(sys.argv) != 2:
+        print("Uso: python auth.py <contraseña>")
+        sys.exit(1)
+    print(get_password_hash(sys.argv[1]))
@@ -0,0 +1 @@
+# Benchmarks de la API (python -m benchmarks.run --help)
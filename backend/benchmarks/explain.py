@@ -0,0 +1,100 @@
+"""
+Verifica que las consultas del listado usen los índices compuestos
+
+Siembra una base SQLite temporal, genera las consultas de
+`GET /productos/` con `consulta_listado` (las mismas que ejecuta la
+ruta) y revisa su plan con EXPLAIN QUERY PLAN: cada caso debe usar el
+índice esperado y no ordenar en una tabla temporal.
+
+Uso (desde backend/):
+    python -m benchmarks.explain
+    python -m benchmarks.explain --productos 20000
+
+Retorna código de salida 1 si algún plan no usa el índice esperado.
+"""
+import os
+import sys
+import shutil
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime
+
+# (descripción, filtros, sort, cursor, índice esperado)
+CASOS = [
+    (
+        "categoria + disponible + rango de precio, orden por precio",
+        {"categoria": "tortas", "disponible": 1, "precio_min": 20000, "precio_max": 80000},
+        "precio_asc", None, "ix_productos_categoria_disponible_precio",
+    ),
+    (
+        "categoria + disponible, orden por precio descendente (página con cursor)",
+        {"categoria": "postres", "disponible": 1},
+        "precio_desc", (500, 50000.0), "ix_productos_categoria_disponible_precio",
+    ),
+    (
+        "disponibles más recientes",
+        {"disponible": 1},
+        "recientes", None, "ix_productos_disponible_fecha_creacion",
+    ),
+    (
+        "disponibles más recientes (página con cursor)",
+        {"disponible": 1},
+        "recientes", (500, datetime(2030, 1, 1)), "ix_productos_disponible_fecha_creacion",
+    ),
+]
+
+
+def _plan(sync_conn, query) -> list:
+    from sqlalchemy import text
+    compilado = query.compile(sync_conn, compile_kwargs={"literal_binds": True})
+    filas = sync_conn.execute(text(f"EXPLAIN QUERY PLAN {compilado}")).all()
+    return [fila[-1] for fila in filas]
+
+
+async def main(args) -> int:
+    tmp = tempfile.mkdtemp(prefix="explain_")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/explain.db"
+    os.environ["MEDIA_PATH"] = os.path.join(tmp, "media")
+
+    from sqlalchemy import text
+    from database import init_db, engine
+    from routes.productos import consulta_listado, _filtros
+    from benchmarks.seed import sembrar
+
+    fallos = 0
+    try:
+        await init_db()
+        await sembrar(args.productos, 0, args.seed)
+        async with engine.connect() as conn:
+            # Estadísticas para el planificador, como en una base en uso
+            await conn.execute(text("ANALYZE"))
+            for descripcion, filtros, sort, despues, indice in CASOS:
+                query = consulta_listado(_filtros(**filtros), sort, despues).limit(20)
+                plan = await conn.run_sync(_plan, query)
+                usa_indice = any(indice in paso for paso in plan)
+                ordena_aparte = any("TEMP B-TREE" in paso for paso in plan)
+                ok = usa_indice and not ordena_aparte
+                fallos += not ok
+                print(f"{'✅' if ok else '❌'} {descripcion}")
+                for paso in plan:
+                    print(f"     {paso}")
+                if not usa_indice:
+                    print(f"     ⚠️ no usa {indice}")
+                if ordena_aparte:
+                    print("     ⚠️ ordena en una tabla temporal")
+    finally:
+        await engine.dispose()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return 1 if fallos else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Revisa los planes de las consultas del listado")
+    parser.add_argument("--productos", type=int, default=5000, help="productos a sembrar")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,279 @@
+"""
+Benchmark de carga de la API
+
+Levanta la app en el mismo proceso (sin red), siembra una base de datos
+temporal y la recorre con un cliente HTTP asíncrono concurrente.
+Reporta throughput y latencias p50/p95/p99 en JSON.
+
+Uso (desde backend/):
+    python -m benchmarks.run --escenario mixto --productos 5000 --concurrencia 20
+    python -m benchmarks.run --escenario catalogo --salida antes.json
+
+Con la misma semilla y parámetros se generan los mismos datos y la misma
+secuencia de operaciones, para comparar resultados entre commits.
+"""
+import os
+import json
+import math
+import shutil
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+
+# Operaciones por escenario (pesos relativos)
+ESCENARIOS = {
+    "catalogo": {"listar": 70, "buscar": 30},
+    "detalle": {"detalle": 100},
+    "admin": {"actualizar": 80, "actualizar_masivo": 20},
+    "subidas": {"subir_imagenes": 100},
+    "mixto": {
+        "listar": 45, "buscar": 15, "detalle": 28,
+        "actualizar": 6, "actualizar_masivo": 2, "subir_imagenes": 4,
+    },
+}
+
+BUSQUEDAS = ["torta", "chocolate", "ancheta fresa", "cupcake", "regalo", "tres leches", "brownie", "postre mini"]
+IMAGENES_POR_SUBIDA = 3
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil por rango más cercano (valores ordenados)"""
+    if not valores:
+        return 0.0
+    rango = math.ceil(p / 100 * len(valores))
+    return valores[min(max(rango, 1), len(valores)) - 1]
+
+
+def resumen(latencias: List[float], errores: int, duracion: float) -> dict:
+    """Throughput y latencias (ms) de un grupo de peticiones"""
+    ordenadas = sorted(latencias)
+    return {
+        "peticiones": len(ordenadas),
+        "errores": errores,
+        "rps": round(len(ordenadas) / duracion, 2) if duracion else 0.0,
+        "p50_ms": round(percentil(ordenadas, 50) * 1000, 3),
+        "p95_ms": round(percentil(ordenadas, 95) * 1000, 3),
+        "p99_ms": round(percentil(ordenadas, 99) * 1000, 3),
+        "max_ms": round(ordenadas[-1] * 1000, 3) if ordenadas else 0.0,
+        "media_ms": round(sum(ordenadas) / len(ordenadas) * 1000, 3) if ordenadas else 0.0,
+    }
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+class Benchmark:
+    """Genera y ejecuta las operaciones de un escenario"""
+
+    def __init__(self, client, headers: dict, total_productos: int, imagenes: List[bytes], seed: int):
+        self.client = client
+        self.headers = headers
+        self.total_productos = total_productos
+        self.imagenes = imagenes
+        self.seed = seed
+        self.cursores: List[str] = []
+
+    def _id(self, rng: random.Random) -> int:
+        return rng.randint(1, self.total_productos)
+
+    async def listar(self, rng: random.Random):
+        from benchmarks.seed import CATEGORIAS
+        params = {"limit": 20}
+        if rng.random() < 0.5:
+            params["categoria"] = rng.choice(CATEGORIAS)
+        if rng.random() < 0.3:
+            params["disponible"] = 1
+        # Parte de la navegación sigue páginas con cursor
+        if self.cursores and rng.random() < 0.4:
+            params = {"limit": 20, "cursor": rng.choice(self.cursores), "incluir_total": "false"}
+        r = await self.client.get("/productos/", params=params)
+        if r.status_code == 200 and len(self.cursores) < 200:
+            cursor = r.json().get("next_cursor")
+            if cursor:
+                self.cursores.append(cursor)
+        return r
+
+    async def buscar(self, rng: random.Random):
+        return await self.client.get("/productos/search", params={"q": rng.choice(BUSQUEDAS)})
+
+    async def detalle(self, rng: random.Random):
+        return await self.client.get(f"/productos/{self._id(rng)}")
+
+    async def actualizar(self, rng: random.Random):
+        return await self.client.put(
+            f"/productos/{self._id(rng)}",
+            data={"precio": str(rng.randrange(5, 200) * 1000)},
+            headers=self.headers
+        )
+
+    async def actualizar_masivo(self, rng: random.Random):
+        items = [
+            {"id": self._id(rng), "disponible": rng.randint(0, 1)}
+            for _ in range(20)
+        ]
+        return await self.client.patch("/productos/bulk", json={"items": items}, headers=self.headers)
+
+    async def subir_imagenes(self, rng: random.Random):
+        archivos = [
+            ("imagenes", (f"foto{i}.jpg", rng.choice(self.imagenes), "image/jpeg"))
+            for i in range(IMAGENES_POR_SUBIDA)
+        ]
+        return await self.client.post(
+            f"/productos/{self._id(rng)}/imagenes", files=archivos, headers=self.headers
+        )
+
+    async def ejecutar(self, pesos: Dict[str, int], peticiones: int, concurrencia: int,
+                       duracion: Optional[float], registrar: bool = True) -> dict:
+        """
+        Ejecuta `peticiones` operaciones (o durante `duracion` segundos)
+        con `concurrencia` clientes simultáneos
+        """
+        operaciones = list(pesos)
+        cuotas = list(pesos.values())
+        resultados: Dict[str, List[float]] = {op: [] for op in operaciones}
+        errores: Dict[str, int] = {op: 0 for op in operaciones}
+        restantes = [peticiones]
+        inicio = time.perf_counter()
+        fin = inicio + duracion if duracion else None
+
+        async def cliente(numero: int):
+            rng = random.Random(self.seed * 1000 + numero)
+            while True:
+                if fin is not None:
+                    if time.perf_counter() >= fin:
+                        return
+                else:
+                    if restantes[0] <= 0:
+                        return
+                    restantes[0] -= 1
+                op = rng.choices(operaciones, cuotas)[0]
+                t = time.perf_counter()
+                try:
+                    r = await getattr(self, op)(rng)
+                    ok = r.status_code < 400
+                except Exception as e:
+                    print(f"⚠️ {op}: {e}")
+                    ok = False
+                resultados[op].append(time.perf_counter() - t)
+                if not ok:
+                    errores[op] += 1
+
+        await asyncio.gather(*(cliente(i) for i in range(concurrencia)))
+        total = time.perf_counter() - inicio
+        if not registrar:
+            return {}
+
+        todas = [lat for lats in resultados.values() for lat in lats]
+        return {
+            "duracion_s": round(total, 3),
+            "total": resumen(todas, sum(errores.values()), total),
+            "operaciones": {
+                op: resumen(resultados[op], errores[op], total)
+                for op in operaciones if resultados[op]
+            },
+        }
+
+
+async def main(args) -> dict:
+    # La configuración se lee al importar los módulos de la app
+    os.environ.setdefault("DB_PROFILE", "bench")
+    tmp = tempfile.mkdtemp(prefix="benchmark_")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{tmp}/benchmark.db"
+    os.environ["MEDIA_PATH"] = os.path.join(tmp, "media")
+    if args.sin_cache:
+        os.environ["CATALOG_CACHE_MAXSIZE"] = "0"
+
+    import httpx
+    from main import app
+    from benchmarks.seed import sembrar, imagen_jpeg
+
+    async with app.router.lifespan_context(app):
+        t = time.perf_counter()
+        total_productos = await sembrar(args.productos, args.imagenes, args.seed)
+        siembra = time.perf_counter() - t
+        print(f"🌱 {total_productos} productos sembrados en {siembra:.1f} s")
+
+        rng = random.Random(args.seed)
+        imagenes = [imagen_jpeg(rng) for _ in range(args.imagenes_distintas)]
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+            r = await client.post("/auth/login", json={"email": args.email, "password": args.password})
+            r.raise_for_status()
+            headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+            bench = Benchmark(client, headers, total_productos, imagenes, args.seed)
+            pesos = ESCENARIOS[args.escenario]
+            if args.calentamiento:
+                await bench.ejecutar(pesos, args.calentamiento, args.concurrencia, None, registrar=False)
+            print(f"⏱️ Ejecutando escenario '{args.escenario}'...")
+            resultado = await bench.ejecutar(pesos, args.peticiones, args.concurrencia, args.duracion)
+
+    shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "escenario": args.escenario,
+        "commit": _commit(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "entorno": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "base_de_datos": os.environ["DATABASE_URL"].split("://", 1)[0],
+            "perfil": os.environ.get("DB_PROFILE"),
+        },
+        "parametros": {
+            "productos": args.productos,
+            "imagenes_por_producto": args.imagenes,
+            "peticiones": None if args.duracion else args.peticiones,
+            "duracion_s": args.duracion,
+            "concurrencia": args.concurrencia,
+            "calentamiento": args.calentamiento,
+            "cache": not args.sin_cache,
+            "seed": args.seed,
+        },
+        "siembra_s": round(siembra, 3),
+        **resultado,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de carga de la API")
+    parser.add_argument("--escenario", choices=sorted(ESCENARIOS), default="mixto")
+    parser.add_argument("--productos", type=int, default=2000, help="productos a sembrar")
+    parser.add_argument("--imagenes", type=int, default=2, help="imágenes por producto sembrado")
+    parser.add_argument("--imagenes-distintas", type=int, default=8, help="imágenes distintas para las subidas")
+    parser.add_argument("--peticiones", type=int, default=2000, help="total de peticiones")
+    parser.add_argument("--duracion", type=float, default=None, help="segundos (reemplaza a --peticiones)")
+    parser.add_argument("--concurrencia", type=int, default=20)
+    parser.add_argument("--calentamiento", type=int, default=100, help="peticiones previas sin medir")
+    parser.add_argument("--sin-cache", action="store_true", help="desactiva el cache del catálogo")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=None,
+                        help="base existente (se le agregan los datos sembrados); por defecto SQLite temporal")
+    parser.add_argument("--email", default="admin@loquieroyacm.com")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--salida", default=None, help="archivo JSON del reporte (por defecto stdout)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    reporte = asyncio.run(main(args))
+    texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+        print(f"✅ Reporte guardado en {args.salida}")
+    else:
+        print(texto)
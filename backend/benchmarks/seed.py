@@ -0,0 +1,95 @@
+"""
+Datos de prueba para los benchmarks
+
+Genera productos e imágenes de forma determinista (misma semilla =>
+mismos datos). Las imágenes apuntan a unos pocos archivos reales en
+MEDIA_PATH, como pasa con las subidas repetidas (direccionadas por
+contenido).
+"""
+import io
+import os
+import random
+from typing import List
+from sqlalchemy import insert, select, func
+from database import AsyncSessionLocal
+from models import Producto, ImagenProducto
+from utils import MEDIA_PATH
+
+CATEGORIAS = ["tortas", "postres", "anchetas", "galletas", "bebidas", "desayunos"]
+NOMBRES = ["Torta", "Ancheta", "Galleta", "Brownie", "Cheesecake", "Cupcake", "Desayuno", "Malteada", "Postre", "Caja"]
+ADJETIVOS = ["de chocolate", "de fresa", "tres leches", "de vainilla", "sorpresa", "especial", "navideña", "de arequipe", "mini", "familiar"]
+PALABRAS = ["crema", "dulce", "colombiano", "relleno", "decorado", "artesanal", "regalo", "cumpleaños", "sin azúcar", "frutos rojos"]
+
+LOTE = 1000
+ARCHIVOS_SEMILLA = 5
+
+
+def imagen_jpeg(rng: random.Random, ancho: int = 1600, alto: int = 1200) -> bytes:
+    """JPEG con colores aleatorios (contenido distinto por semilla)"""
+    from PIL import Image, ImageDraw
+    img = Image.new("RGB", (ancho, alto), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(ancho), rng.randrange(alto)
+        draw.ellipse((x, y, x + rng.randrange(50, 400), y + rng.randrange(50, 400)),
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def _archivos_semilla(rng: random.Random) -> List[str]:
+    """Escribe unas pocas imágenes reales y retorna sus URLs"""
+    directorio = os.path.join(MEDIA_PATH, "productos", "benchmark")
+    os.makedirs(directorio, exist_ok=True)
+    urls = []
+    for i in range(ARCHIVOS_SEMILLA):
+        with open(os.path.join(directorio, f"semilla_{i}.jpg"), "wb") as f:
+            f.write(imagen_jpeg(rng, 800, 600))
+        urls.append(f"/media/productos/benchmark/semilla_{i}.jpg")
+    return urls
+
+
+async def sembrar(productos: int, imagenes_por_producto: int, seed: int = 42) -> int:
+    """
+    Inserta `productos` productos con `imagenes_por_producto` imágenes
+    cada uno. Retorna el total de productos en la base.
+    """
+    rng = random.Random(seed)
+    urls = _archivos_semilla(rng) if imagenes_por_producto else []
+
+    async with AsyncSessionLocal() as db:
+        inicial = (await db.execute(select(func.max(Producto.id)))).scalar() or 0
+
+        for inicio in range(0, productos, LOTE):
+            filas = []
+            for _ in range(min(LOTE, productos - inicio)):
+                nombre = f"{rng.choice(NOMBRES)} {rng.choice(ADJETIVOS)}"
+                filas.append({
+                    "nombre": nombre,
+                    "descripcion": " ".join(rng.sample(PALABRAS, 4)),
+                    "precio": float(rng.randrange(5, 200) * 1000),
+                    "categoria": rng.choice(CATEGORIAS),
+                    "disponible": 1 if rng.random() < 0.85 else 0,
+                    "creado_por": "benchmark@loquieroyacm.com",
+                    "version": 1,
+                })
+            await db.execute(insert(Producto), filas)
+
+        if imagenes_por_producto:
+            ids = range(inicial + 1, inicial + productos + 1)
+            imagenes = [
+                {
+                    "producto_id": producto_id,
+                    "url_imagen": rng.choice(urls),
+                    "orden": orden,
+                    "estado": "lista",
+                }
+                for producto_id in ids
+                for orden in range(1, imagenes_por_producto + 1)
+            ]
+            for inicio in range(0, len(imagenes), LOTE):
+                await db.execute(insert(ImagenProducto), imagenes[inicio:inicio + LOTE])
+
+        await db.commit()
+        return (await db.execute(select(func.count(Producto.id)))).scalar()
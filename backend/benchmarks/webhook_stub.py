@@ -0,0 +1,110 @@
+"""
+Webhook local para probar la entrega del outbox sin n8n
+
+Recibe los POST, descarta duplicados por Idempotency-Key y puede fallar
+o demorar una parte de las peticiones para ver los reintentos.
+
+Uso (desde backend/):
+    python -m benchmarks.webhook_stub --puerto 8765 --fallar 0.3 --demora 0.5
+    N8N_WEBHOOK_URL=http://127.0.0.1:8765/webhook/nuevo-pedido uvicorn main:app
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Estado:
+    """Contadores compartidos entre los hilos del servidor"""
+
+    def __init__(self, fallar: float, demora: float):
+        self.fallar = fallar
+        self.demora = demora
+        self.lock = threading.Lock()
+        self.claves = set()
+        self.recibidos = 0
+        self.duplicados = 0
+        self.fallados = 0
+
+
+def crear_handler(estado: Estado):
+    class Handler(BaseHTTPRequestHandler):
+        def _responder(self, status: int, cuerpo: dict):
+            data = json.dumps(cuerpo, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            largo = int(self.headers.get("Content-Length") or 0)
+            cuerpo = self.rfile.read(largo)
+            clave = self.headers.get("Idempotency-Key")
+            if estado.demora:
+                time.sleep(random.uniform(0, estado.demora))
+
+            with estado.lock:
+                if random.random() < estado.fallar:
+                    estado.fallados += 1
+                    falla = True
+                else:
+                    falla = False
+                    estado.recibidos += 1
+                    duplicado = clave is not None and clave in estado.claves
+                    if duplicado:
+                        estado.duplicados += 1
+                    elif clave:
+                        estado.claves.add(clave)
+
+            if falla:
+                print(f"💥 {clave} (intento {self.headers.get('X-Intento')}): error simulado")
+                self._responder(503, {"success": False})
+                return
+
+            try:
+                pedido = json.loads(cuerpo).get("id")
+            except ValueError:
+                pedido = None
+            marca = "🔁 duplicado" if duplicado else "📨"
+            print(f"{marca} {self.headers.get('X-Evento')} pedido={pedido} clave={clave} "
+                  f"intento={self.headers.get('X-Intento')}")
+            self._responder(200, {"success": True, "pedidoId": pedido})
+
+        def do_GET(self):
+            with estado.lock:
+                self._responder(200, {
+                    "recibidos": estado.recibidos,
+                    "unicos": len(estado.claves),
+                    "duplicados": estado.duplicados,
+                    "fallados": estado.fallados,
+                })
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Webhook local para probar el outbox")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--fallar", type=float, default=0.0, help="fracción de peticiones que responden 503")
+    parser.add_argument("--demora", type=float, default=0.0, help="demora máxima por petición (segundos)")
+    args = parser.parse_args(argv)
+
+    estado = Estado(args.fallar, args.demora)
+    servidor = ThreadingHTTPServer(("127.0.0.1", args.puerto), crear_handler(estado))
+    print(f"🪝 Webhook de prueba en http://127.0.0.1:{args.puerto}/ (GET para ver contadores)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
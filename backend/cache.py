@@ -0,0 +1,189 @@
+"""
+Cache en memoria para respuestas del catálogo
+"""
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from fastapi import Request, Response
+from compression import COMPRESSION_MIN_SIZE, compress, negotiate
+
+# Configuración
+CATALOG_CACHE_MAXSIZE = int(os.getenv("CATALOG_CACHE_MAXSIZE", "256"))
+# El cache es por proceso: `invalidate()` solo limpia el worker que atendió la
+# escritura, los demás sirven el catálogo anterior hasta que vence el TTL
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+
+
+class CachedResponse:
+    """
+    Cuerpo JSON ya serializado junto con sus validadores HTTP y, a
+    medida que se piden, sus versiones comprimidas
+    """
+    __slots__ = ("body", "etag", "_encoded")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        # ETag fuerte: mismo contenido => mismo ETag en cualquier worker.
+        # No se envía Last-Modified: la hora en que se llenó el cache no es
+        # la del último cambio (y un producto eliminado no tiene fecha).
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self._encoded: Dict[str, bytes] = {}
+
+    def encoded(self, encoding: str) -> bytes:
+        """Cuerpo comprimido con `encoding`; se comprime una sola vez por entrada"""
+        data = self._encoded.get(encoding)
+        if data is None:
+            data = self._encoded[encoding] = compress(self.body, encoding)
+        return data
+
+    def encoded_etag(self, encoding: str) -> str:
+        """ETag de la representación comprimida (distinta de la original)"""
+        return self.etag[:-1] + "-" + encoding + '"'
+
+
+class ResponseCache:
+    """
+    Cache LRU con expiración (TTL) para respuestas ya serializadas
+
+    Cada invalidación incrementa `version`; un valor calculado antes de
+    una invalidación no se guarda, así una lectura lenta concurrente con
+    una escritura no deja datos viejos en el cache. Lo mismo con un valor
+    leído de una réplica que puede no tener aún la última escritura.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self.invalidado = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._listeners: List[Callable[[], None]] = []
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Retorna el valor guardado o None si no existe o expiró"""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        version: Optional[int] = None,
+        ttl: Optional[float] = None,
+        retraso: float = 0.0
+    ) -> None:
+        """
+        Guarda un valor. Si se pasa `version` y el cache fue invalidado
+        desde entonces, el valor se descarta. `ttl` acorta la
+        expiración de este valor (nunca supera la del cache). `retraso`
+        es cuánto puede estar atrasada la fuente (réplica): si hubo una
+        invalidación en ese lapso, el valor no se guarda.
+        """
+        if self.maxsize <= 0 or (version is not None and version != self.version):
+            return
+        if retraso and time.monotonic() - self.invalidado < retraso:
+            return
+
+        expires = time.monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl))
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        """Elimina un valor si existe"""
+        self._data.pop(key, None)
+
+    def on_invalidate(self, listener: Callable[[], None]) -> None:
+        """Registra una función que se llama después de cada invalidación"""
+        self._listeners.append(listener)
+
+    def invalidate(self) -> None:
+        """Vacía el cache (se llama después de cada escritura)"""
+        self._data.clear()
+        self.version += 1
+        self.invalidado = time.monotonic()
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                print(f"⚠️ Error notificando la invalidación del cache: {e}")
+
+    def stats(self) -> dict:
+        """Contadores de uso del cache"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# Cache compartido por las rutas públicas del catálogo
+catalog_cache = ResponseCache(maxsize=CATALOG_CACHE_MAXSIZE, ttl=CATALOG_CACHE_TTL)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110)"""
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def conditional_response(request: Request, entry: CachedResponse) -> Response:
+    """
+    Construye la respuesta para una entrada del cache, respondiendo
+    304 Not Modified cuando el cliente ya tiene la misma versión.
+    El cuerpo se envía comprimido si el cliente lo acepta.
+    """
+    encoding = None
+    if len(entry.body) >= COMPRESSION_MIN_SIZE:
+        encoding = negotiate(request.headers.get("accept-encoding"))
+    etag = entry.encoded_etag(encoding) if encoding else entry.etag
+    
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+    }
+    if len(entry.body) >= COMPRESSION_MIN_SIZE:
+        headers["Vary"] = "Accept-Encoding"
+
+    # Cualquier representación de la misma versión sirve para el 304
+    if_none_match = request.headers.get("if-none-match")
+    not_modified = if_none_match is not None and any(
+        _etag_matches(if_none_match, candidato)
+        for candidato in (entry.etag, entry.encoded_etag("br"), entry.encoded_etag("gzip"))
+    )
+
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(content=entry.encoded(encoding), media_type="application/json", headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
@@ -0,0 +1,128 @@
+"""
+Registro de cambios del catálogo para `GET /productos/changes` (SSE)
+
+Cada cambio recibe una versión creciente del catálogo y se guarda en un
+registro en memoria de tamaño fijo. Un cliente que se reconecta con
+`Last-Event-ID` recibe los cambios que se perdió; si ya no están en el
+registro (o el id es de otro proceso) recibe un evento `reset` y debe
+volver a cargar el catálogo.
+
+El registro es por proceso: con varios workers de Gunicorn cada uno
+tiene su propia secuencia (el id del evento incluye el proceso).
+
+Cada conexión dura como máximo CHANGES_MAX_DURATION segundos: Uvicorn
+espera a que terminen las respuestas abiertas antes de apagarse, y el
+cliente reconecta solo (con `Last-Event-ID`) sin perder cambios.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+from collections import deque
+from typing import AsyncIterator, List, Optional, Tuple
+
+# Configuración
+CHANGES_LOG_SIZE = int(os.getenv("CHANGES_LOG_SIZE", "1000"))  # cambios en memoria
+CHANGES_KEEPALIVE = float(os.getenv("CHANGES_KEEPALIVE", "15"))  # segundos entre comentarios
+CHANGES_RETRY_MS = int(os.getenv("CHANGES_RETRY_MS", "5000"))  # reconexión sugerida al navegador
+CHANGES_MAX_DURATION = float(os.getenv("CHANGES_MAX_DURATION", "300"))  # segundos por conexión
+
+
+def _evento(nombre: str, event_id: str, data: dict) -> str:
+    """Evento en formato text/event-stream"""
+    return f"id: {event_id}\nevent: {nombre}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class ChangeLog:
+    """
+    Cambios recientes del catálogo con su versión, y aviso a los
+    clientes conectados
+    """
+
+    def __init__(self, maxsize: int = CHANGES_LOG_SIZE):
+        self.version = 0
+        self.clientes = 0
+        # Identifica este proceso: un id de otro proceso no se puede reanudar
+        self.instancia = uuid.uuid4().hex[:8]
+        self._cambios: "deque[Tuple[int, str, dict]]" = deque(maxlen=max(1, maxsize))
+        self._nuevo = asyncio.Event()
+
+    def publicar(self, tipo: str, **datos) -> int:
+        """Registra un cambio y despierta a los clientes. Retorna la nueva versión."""
+        self.version += 1
+        self._cambios.append((self.version, tipo, {"version": self.version, "tipo": tipo, **datos}))
+        aviso, self._nuevo = self._nuevo, asyncio.Event()
+        aviso.set()
+        return self.version
+
+    def event_id(self, version: int) -> str:
+        return f"{self.instancia}-{version}"
+
+    def _version_de(self, last_event_id: Optional[str]) -> Optional[int]:
+        """Versión de un Last-Event-ID de este proceso, o None"""
+        if not last_event_id:
+            return None
+        instancia, _, version = last_event_id.strip().partition("-")
+        if instancia != self.instancia or not version.isdigit():
+            return None
+        version = int(version)
+        return version if version <= self.version else None
+
+    def desde(self, version: int) -> Optional[List[Tuple[int, str, dict]]]:
+        """
+        Cambios posteriores a `version`, o None si algunos ya salieron
+        del registro
+        """
+        if version >= self.version:
+            return []
+        if not self._cambios or self._cambios[0][0] > version + 1:
+            return None
+        return [cambio for cambio in self._cambios if cambio[0] > version]
+
+    async def stream(self, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Eventos SSE para un cliente, desde su Last-Event-ID o desde ahora"""
+        self.clientes += 1
+        fin = time.monotonic() + CHANGES_MAX_DURATION
+        try:
+            yield f"retry: {CHANGES_RETRY_MS}\n\n"
+
+            version = self._version_de(last_event_id)
+            if version is None:
+                # Conexión nueva (versión actual) o imposible de reanudar (reset)
+                nombre = "reset" if last_event_id else "catalogo"
+                version = self.version
+                yield _evento(nombre, self.event_id(version), {"version": version})
+
+            while time.monotonic() < fin:
+                aviso = self._nuevo
+                cambios = self.desde(version)
+                if cambios is None:
+                    # El cliente quedó atrás más de CHANGES_LOG_SIZE cambios
+                    version = self.version
+                    yield _evento("reset", self.event_id(version), {"version": version})
+                    continue
+                for numero, tipo, data in cambios:
+                    yield _evento(tipo, self.event_id(numero), data)
+                    version = numero
+                if cambios:
+                    continue
+                espera = min(CHANGES_KEEPALIVE, fin - time.monotonic())
+                try:
+                    await asyncio.wait_for(aviso.wait(), max(espera, 0))
+                except asyncio.TimeoutError:
+                    # Comentario para que proxies no cierren la conexión
+                    yield ": ping\n\n"
+        finally:
+            self.clientes -= 1
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "en_registro": len(self._cambios),
+            "clientes": self.clientes,
+        }
+
+
+# Registro compartido por las rutas del catálogo
+change_log = ChangeLog()
@@ -0,0 +1,192 @@
+"""
+Compresión de respuestas (brotli / gzip) según Accept-Encoding
+
+Brotli es opcional: si el paquete `brotli` no está instalado solo se
+usa gzip. Las respuestas del cache del catálogo se comprimen una vez
+por entrada (ver `CachedResponse.encoded`); el middleware comprime el
+resto de respuestas JSON y de texto.
+"""
+import os
+import zlib
+from functools import lru_cache
+from typing import Optional
+
+# Configuración
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # bytes
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+# Tipos que ya vienen comprimidos o que se envían por eventos
+SIN_COMPRESION = ("image/", "video/", "audio/", "application/zip", "application/gzip", "text/event-stream")
+
+
+@lru_cache(maxsize=1)
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Codificación a usar para un Accept-Encoding: "br", "gzip" o None.
+    Respeta q=0 y, a igual preferencia, prefiere brotli.
+    """
+    if not accept_encoding:
+        return None
+    aceptadas = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        q = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                q = float(parametros[2:])
+            except ValueError:
+                q = 0.0
+        aceptadas[nombre.strip()] = q
+
+    comodin = aceptadas.get("*", 0.0)
+    candidatas = []
+    if _brotli() is not None:
+        candidatas.append("br")
+    candidatas.append("gzip")
+    mejor, mejor_q = None, 0.0
+    for codificacion in candidatas:
+        q = aceptadas.get(codificacion, comodin)
+        if q > mejor_q:
+            mejor, mejor_q = codificacion, q
+    return mejor
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Comprime un cuerpo completo"""
+    if encoding == "br":
+        return _brotli().compress(data, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class _Compressor:
+    """Compresión incremental para respuestas enviadas por partes"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._obj = _brotli().Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def process(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def add_vary(headers: list, value: bytes = b"Accept-Encoding") -> None:
+    """Agrega un valor a Vary (headers ASGI crudos)"""
+    for i, (nombre, actual) in enumerate(headers):
+        if nombre.lower() == b"vary":
+            if value.lower() not in actual.lower():
+                headers[i] = (nombre, actual + b", " + value)
+            return
+    headers.append((b"vary", value))
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI: comprime las respuestas cuando el cliente lo acepta.
+    No toca respuestas pequeñas, ya codificadas (p. ej. las del cache
+    del catálogo), de /media ni de tipos ya comprimidos.
+    """
+
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") == "HEAD" or scope.get("path", "").startswith("/media/"):
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = None
+        for nombre, valor in scope.get("headers", []):
+            if nombre == b"accept-encoding":
+                accept_encoding = valor.decode("latin-1")
+                break
+        encoding = negotiate(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio = None
+        compressor: Optional[_Compressor] = None
+        omitir = False
+
+        async def send_wrapper(message):
+            nonlocal inicio, compressor, omitir
+
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                tipo = b""
+                for nombre, valor in headers:
+                    nombre = nombre.lower()
+                    if nombre == b"content-encoding":
+                        omitir = True
+                    elif nombre == b"content-type":
+                        tipo = valor.lower()
+                if message["status"] < 200 or message["status"] in (204, 304) or tipo.decode("latin-1").startswith(SIN_COMPRESION):
+                    omitir = True
+                if omitir:
+                    await send(message)
+                else:
+                    # Se espera el primer bloque del cuerpo para decidir
+                    inicio = message
+                return
+
+            if message["type"] != "http.response.body" or omitir:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if inicio is not None:
+                headers = [
+                    (nombre, valor) for nombre, valor in inicio.get("headers", [])
+                    if nombre.lower() != b"content-length"
+                ]
+                if not more_body and len(body) < self.min_size:
+                    omitir = True
+                    await send(inicio)
+                    await send(message)
+                    return
+
+                headers.append((b"content-encoding", encoding.encode()))
+                add_vary(headers)
+                if not more_body:
+                    body = compress(body, encoding)
+                    headers.append((b"content-length", str(len(body)).encode()))
+                    await send({**inicio, "headers": headers})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+                # Respuesta por partes (streaming): compresión incremental
+                compressor = _Compressor(encoding)
+                await send({**inicio, "headers": headers})
+                inicio = None
+
+            data = compressor.process(body)
+            if not more_body:
+                data += compressor.finish()
+            if data or not more_body:
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,46 +1,418 @@
 """
 Configuración de la base de datos
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text, Table, Column, Integer, select
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.exc import InterfaceError, OperationalError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from typing import List, Optional
+from contextvars import ContextVar
+from fastapi import Request, Response
 import os
+import time
+import asyncio
 from dotenv import load_dotenv
+from search import crear_indice_busqueda
+from metrics import registrar_consulta, db_pool_wait
 
 load_dotenv()
 
 # Obtener URL de base de datos
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./loquieroya.db")
 
-# Si es PostgreSQL de Render, convertir a formato asyncpg
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql+asyncpg://", 1)
-elif DATABASE_URL.startswith("postgresql://"):
-    DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+def _normalizar_url(url: str) -> str:
+    """Si es PostgreSQL de Render, convertir a formato asyncpg"""
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+DATABASE_URL = _normalizar_url(DATABASE_URL)
+
+# Réplicas de solo lectura (opcional), separadas por comas
+DATABASE_REPLICA_URLS = [
+    _normalizar_url(url.strip())
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "10"))
+REPLICA_HEALTH_TIMEOUT = float(os.getenv("REPLICA_HEALTH_TIMEOUT", "2"))
+# Retraso máximo de replicación: durante este tiempo después de escribir, las
+# lecturas del mismo cliente van al primario (cookie REPLICA_STICKY_COOKIE)
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_STICKY_COOKIE = "lee_primario"
+
+# Perfiles del motor: dev (registra cada SQL), prod (por defecto) y bench
+PERFILES = {
+    "dev": {
+        "echo": True,
+        "pool_size": 5,
+        "max_overflow": 5,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+        "statement_cache_size": 100,
+        "sqlite_journal_mode": "WAL",
+        "sqlite_synchronous": "FULL",
+        "sqlite_mmap_size": 0,
+        "sqlite_cache_size": -2000,
+    },
+    "prod": {
+        "echo": False,
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+        "statement_cache_size": 500,
+        "sqlite_journal_mode": "WAL",
+        "sqlite_synchronous": "NORMAL",
+        "sqlite_mmap_size": 268435456,  # 256 MB
+        "sqlite_cache_size": -64000,  # 64 MB (negativo = KiB)
+    },
+    "bench": {
+        "echo": False,
+        "pool_size": 20,
+        "max_overflow": 40,
+        "pool_pre_ping": False,
+        "pool_recycle": -1,
+        "statement_cache_size": 1000,
+        "sqlite_journal_mode": "WAL",
+        "sqlite_synchronous": "NORMAL",
+        "sqlite_mmap_size": 268435456,
+        "sqlite_cache_size": -64000,
+    },
+}
+
+DB_PROFILE = os.getenv("DB_PROFILE", "prod").lower()
+if DB_PROFILE not in PERFILES:
+    print(f"⚠️ DB_PROFILE desconocido '{DB_PROFILE}', se usa 'prod'")
+    DB_PROFILE = "prod"
+
+
+def _opcion(nombre: str):
+    """Valor del perfil, reemplazable con la variable DB_<NOMBRE> (p. ej. DB_POOL_SIZE)"""
+    valor = PERFILES[DB_PROFILE][nombre]
+    env = os.getenv(f"DB_{nombre.upper()}")
+    if env is None:
+        return valor
+    if isinstance(valor, bool):
+        return env.lower() == "true"
+    if isinstance(valor, int):
+        return int(env)
+    return env
+
+
+def _engine_options(url: str) -> dict:
+    """Argumentos de create_async_engine según el motor y el perfil"""
+    opciones = {"echo": _opcion("echo"), "future": True}
+    if url.startswith("postgresql+asyncpg"):
+        opciones.update(
+            pool_size=_opcion("pool_size"),
+            max_overflow=_opcion("max_overflow"),
+            pool_pre_ping=_opcion("pool_pre_ping"),
+            pool_recycle=_opcion("pool_recycle"),
+            # Cache de sentencias preparadas por conexión (0 si se usa pgbouncer)
+            connect_args={"prepared_statement_cache_size": _opcion("statement_cache_size")},
+        )
+    return opciones
+
+
+def _configurar_sqlite(engine) -> None:
+    """Aplica los PRAGMA del perfil a cada conexión SQLite nueva"""
+    pragmas = [
+        f"PRAGMA synchronous={_opcion('sqlite_synchronous')}",
+        f"PRAGMA mmap_size={_opcion('sqlite_mmap_size')}",
+        f"PRAGMA cache_size={_opcion('sqlite_cache_size')}",
+        "PRAGMA busy_timeout=5000",
+    ]
+    # WAL no aplica a bases en memoria
+    if engine.url.database not in (None, "", ":memory:"):
+        pragmas.insert(0, f"PRAGMA journal_mode={_opcion('sqlite_journal_mode')}")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def _medir_consultas(engine, etiqueta: str) -> None:
+    """Registra cantidad y duración de cada consulta en /metrics"""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _inicio(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _fin(conn, cursor, statement, parameters, context, executemany):
+        inicios = conn.info.get("inicio_consulta")
+        if inicios:
+            registrar_consulta(etiqueta, time.perf_counter() - inicios.pop())
+
+
+def _crear_engine(url: str, etiqueta: str = "primario"):
+    """Motor asíncrono con las opciones del perfil"""
+    nuevo = create_async_engine(url, **_engine_options(url))
+    if nuevo.dialect.name == "sqlite":
+        _configurar_sqlite(nuevo)
+    _medir_consultas(nuevo, etiqueta)
+    return nuevo
+
+
+def _crear_sesiones(motor):
+    return sessionmaker(motor, class_=AsyncSession, expire_on_commit=False)
+
 
 # Motor asíncrono
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=True,
-    future=True
-)
+engine = _crear_engine(DATABASE_URL)
 
 # Sesión asíncrona
-AsyncSessionLocal = sessionmaker(
-    engine,
-    class_=AsyncSession,
-    expire_on_commit=False
-)
+AsyncSessionLocal = _crear_sesiones(engine)
+
+
+class Replica:
+    """Réplica de lectura y su estado de salud"""
+
+    def __init__(self, url: str, etiqueta: str):
+        self.etiqueta = etiqueta
+        self.engine = _crear_engine(url, etiqueta)
+        self.sessionmaker = _crear_sesiones(self.engine)
+        self.nombre = self.engine.url.render_as_string(hide_password=True)
+        self.sana = True
+        self.fallos = 0
+        self.lecturas = 0
+
+
+class ReplicaRouter:
+    """
+    Reparte las lecturas entre réplicas sanas (round-robin)
+
+    Las lecturas van al primario si no hay réplicas sanas, si la petición
+    en curso ya escribió o si se pide `primario` (el cliente escribió hace
+    poco): así quien acaba de escribir lee sus propios cambios aunque la
+    réplica tenga retraso.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(url, f"replica_{i}") for i, url in enumerate(urls, start=1)]
+        self.lecturas_primario = 0
+        self._siguiente = 0
+        self._tarea: Optional[asyncio.Task] = None
+
+    def elegir(self, primario: bool = False) -> Optional[Replica]:
+        """Próxima réplica sana, o None para leer del primario"""
+        if self.replicas and not primario and not escribio_en_peticion():
+            for _ in range(len(self.replicas)):
+                replica = self.replicas[self._siguiente % len(self.replicas)]
+                self._siguiente += 1
+                if replica.sana:
+                    replica.lecturas += 1
+                    return replica
+        self.lecturas_primario += 1
+        return None
+
+    def marcar_caida(self, replica: Replica, error: Exception) -> None:
+        replica.fallos += 1
+        if replica.sana:
+            replica.sana = False
+            detalle = str(error).splitlines()[0] if str(error) else type(error).__name__
+            print(f"⚠️ Réplica fuera de servicio ({replica.nombre}): {detalle}")
+
+    async def verificar(self) -> None:
+        """Health check: SELECT 1 en cada réplica"""
+        for replica in self.replicas:
+            try:
+                async with replica.engine.connect() as conn:
+                    await asyncio.wait_for(conn.execute(text("SELECT 1")), REPLICA_HEALTH_TIMEOUT)
+            except Exception as e:
+                self.marcar_caida(replica, e)
+            else:
+                if not replica.sana:
+                    print(f"✅ Réplica disponible de nuevo ({replica.nombre})")
+                replica.sana = True
+
+    async def _vigilar(self) -> None:
+        while True:
+            await asyncio.sleep(REPLICA_HEALTH_INTERVAL)
+            await self.verificar()
+
+    async def start(self) -> None:
+        """Verifica las réplicas y lanza el health check periódico"""
+        if not self.replicas:
+            return
+        await self.verificar()
+        self._tarea = asyncio.create_task(self._vigilar())
+        sanas = sum(replica.sana for replica in self.replicas)
+        print(f"✅ Réplicas de lectura: {sanas}/{len(self.replicas)} disponibles")
+
+    async def shutdown(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self) -> dict:
+        """Estado de las réplicas"""
+        return {
+            "lecturas_primario": self.lecturas_primario,
+            "replicas": [
+                {
+                    "url": replica.nombre,
+                    "sana": replica.sana,
+                    "fallos": replica.fallos,
+                    "lecturas": replica.lecturas,
+                }
+                for replica in self.replicas
+            ],
+        }
+
+
+replica_router = ReplicaRouter(DATABASE_REPLICA_URLS)
+
+
+# Escrituras de la petición en curso: [hubo escritura]. Las tareas en
+# segundo plano no tienen marcador y no afectan a otras lecturas.
+_escritura_peticion: ContextVar[Optional[List[bool]]] = ContextVar("escritura_peticion", default=None)
+
+
+def _iniciar_peticion(request: Request) -> None:
+    """
+    Apunta el marcador de escrituras a la petición (get_db / get_read_db);
+    las dependencias de una misma petición comparten el marcador
+    """
+    _escritura_peticion.set(request.scope.setdefault("escrituras", [False]))
+
+
+def escribio_en_peticion() -> bool:
+    marca = _escritura_peticion.get()
+    return marca is not None and marca[0]
+
+
+def retraso_replica(session: AsyncSession) -> float:
+    """Segundos que pueden faltar en los datos leídos con `session`"""
+    return REPLICA_STICKY_SECONDS if session.info.get("replica") else 0.0
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _registrar_escritura(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+        marca = _escritura_peticion.get()
+        if marca is not None:
+            marca[0] = True
+
 
 class Base(DeclarativeBase):
     pass
 
-async def get_db():
+
+# Versión del esquema aplicada a la base de datos
+schema_version = Table(
+    "schema_version",
+    Base.metadata,
+    Column("version", Integer, nullable=False)
+)
+
+
+def _crear_indices(conn, tabla: Table, *nombres: str):
+    """Crea los índices del modelo con esos nombres si todavía no existen"""
+    for index in tabla.indexes:
+        if index.name in nombres:
+            index.create(conn, checkfirst=True)
+
+
+def _crear_indices_productos(conn):
+    """Índices de paginación por cursor en tablas ya existentes"""
+    from models import Producto
+    _crear_indices(conn, Producto.__table__, "ix_productos_categoria_id", "ix_productos_disponible_id")
+
+
+def _agregar_columna(conn, tabla: str, columna: str, ddl: str):
+    """Agrega una columna solo si todavía no existe"""
+    existentes = {c["name"] for c in inspect(conn).get_columns(tabla)}
+    if columna not in existentes:
+        conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {ddl}"))
+
+
+def _agregar_estado_imagenes(conn):
+    """Columna estado en imagenes_productos"""
+    _agregar_columna(conn, "imagenes_productos", "estado", "VARCHAR(20) DEFAULT 'lista'")
+
+
+def _agregar_variantes_imagenes(conn):
+    """Columna variantes en imagenes_productos"""
+    _agregar_columna(conn, "imagenes_productos", "variantes", "JSON")
+
+
+def _agregar_hash_imagenes(conn):
+    """Columna hash_contenido e índices de referencias en imagenes_productos"""
+    from models import ImagenProducto
+    _agregar_columna(conn, "imagenes_productos", "hash_contenido", "VARCHAR(64)")
+    for index in ImagenProducto.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def _agregar_version_productos(conn):
+    """Columna version en productos"""
+    _agregar_columna(conn, "productos", "version", "INTEGER NOT NULL DEFAULT 1")
+
+
+def _crear_indices_filtros(conn):
+    """Índices compuestos para filtros por precio y orden por fecha"""
+    from models import Producto
+    _crear_indices(
+        conn, Producto.__table__,
+        "ix_productos_categoria_disponible_precio", "ix_productos_disponible_fecha_creacion"
+    )
+
+
+def _crear_tablas_pedidos(conn):
+    """Tablas pedidos y outbox"""
+    from models import Pedido, OutboxEvento
+    Pedido.__table__.create(conn, checkfirst=True)
+    OutboxEvento.__table__.create(conn, checkfirst=True)
+
+
+# Migraciones incrementales, en orden. Cada una debe poder ejecutarse
+# también sobre una base recién creada con create_all.
+MIGRACIONES = [
+    _crear_indices_productos,
+    crear_indice_busqueda,
+    _agregar_estado_imagenes,
+    _agregar_variantes_imagenes,
+    _agregar_hash_imagenes,
+    _agregar_version_productos,
+    _crear_indices_filtros,
+    _crear_tablas_pedidos,
+]
+SCHEMA_VERSION = len(MIGRACIONES)
+
+async def _checkout(session: AsyncSession, etiqueta: str) -> None:
+    """Obtiene la conexión de la sesión midiendo la espera del pool"""
+    inicio = time.perf_counter()
+    await session.connection()
+    db_pool_wait.observe(time.perf_counter() - inicio, etiqueta)
+
+
+async def get_db(request: Request, response: Response):
     """
     Dependency para obtener sesión de base de datos
+    
+    Marca al cliente para que sus lecturas de los próximos
+    REPLICA_STICKY_SECONDS vayan al primario.
     """
+    _iniciar_peticion(request)
+    if replica_router.replicas:
+        response.set_cookie(
+            REPLICA_STICKY_COOKIE, "1",
+            max_age=max(1, int(REPLICA_STICKY_SECONDS)),
+            httponly=True, secure=True, samesite="none"
+        )
     async with AsyncSessionLocal() as session:
         try:
+            await _checkout(session, "primario")
             yield session
             await session.commit()
         except Exception:
@@ -49,10 +421,104 @@ async def get_db():
         finally:
             await session.close()
 
+def _error_de_conexion(error: Optional[BaseException]) -> Optional[BaseException]:
+    """Busca un error de conexión en la cadena de excepciones"""
+    vistos = set()
+    while error is not None and id(error) not in vistos:
+        if isinstance(error, (OperationalError, InterfaceError, OSError)):
+            return error
+        vistos.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def read_sessionmaker(primario: bool = False):
+    """
+    Fábrica de sesiones para lecturas: una réplica si hay alguna
+    disponible, el primario si no. Retorna (fábrica, réplica o None).
+    """
+    replica = replica_router.elegir(primario)
+    if replica is None:
+        return AsyncSessionLocal, None
+    return replica.sessionmaker, replica
+
+
+async def get_read_db(request: Request):
+    """
+    Dependency para rutas de solo lectura (pueden ir a una réplica)
+    """
+    _iniciar_peticion(request)
+    fabrica, replica = read_sessionmaker(REPLICA_STICKY_COOKIE in request.cookies)
+    session = fabrica()
+    try:
+        await _checkout(session, replica.etiqueta if replica else "primario")
+    except Exception as e:
+        if replica is None or _error_de_conexion(e) is None:
+            await session.close()
+            raise
+        # La réplica no responde: esta petición se atiende desde el primario
+        replica_router.marcar_caida(replica, e)
+        await session.close()
+        replica, session = None, AsyncSessionLocal()
+        await _checkout(session, "primario")
+    if replica is not None:
+        session.info["replica"] = replica.etiqueta
+
+    async with session:
+        try:
+            yield session
+        except Exception as e:
+            # Falla de conexión (aunque la ruta la haya envuelto en un
+            # HTTPException): la réplica deja de recibir lecturas hasta
+            # que el health check la vea sana otra vez
+            error = _error_de_conexion(e)
+            if replica is not None and error is not None:
+                replica_router.marcar_caida(replica, error)
+            raise
+        finally:
+            await session.close()
+
 async def init_db():
     """
     Inicializar base de datos
     """
+    print(f"🗄️ Base de datos: {engine.dialect.name} (perfil {DB_PROFILE})")
+    
+    # Esquema al día: una sola consulta en lugar de reflejar las tablas
+    actual = await _version_guardada()
+    if actual is not None and actual >= SCHEMA_VERSION:
+        if actual > SCHEMA_VERSION:
+            print(f"⚠️ La base de datos está en la versión {actual} y el código en la {SCHEMA_VERSION}")
+        return
+    
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_aplicar_migraciones)
+
+
+async def _version_guardada() -> Optional[int]:
+    """Versión del esquema guardada, o None si la tabla no existe todavía"""
+    try:
+        async with engine.connect() as conn:
+            return (await conn.execute(select(schema_version.c.version))).scalar()
+    except Exception:
+        return None
+
+
+def _aplicar_migraciones(conn):
+    """
+    Aplica las migraciones pendientes y guarda la nueva versión
+    """
+    actual = conn.execute(select(schema_version.c.version)).scalar()
+    if actual is None:
+        conn.execute(schema_version.insert().values(version=0))
+        actual = 0
+    
+    for numero, migracion in enumerate(MIGRACIONES, start=1):
+        if numero > actual:
+            migracion(conn)
+            print(f"✅ Migración {numero} aplicada: {migracion.__doc__}")
+    
+    if actual != SCHEMA_VERSION:
+        conn.execute(schema_version.update().values(version=SCHEMA_VERSION))
 
@@ -0,0 +1,94 @@
+"""
+Fragmentos JSON pre-serializados de productos
+
+Cada producto se serializa una sola vez por versión y el fragmento se
+reutiliza en los listados, la búsqueda y el detalle: las respuestas se
+arman uniendo bytes, sin validar con pydantic en cada petición.
+
+Los fragmentos se generan con el mismo serializador de la respuesta
+(`ProductoResponse.model_dump_json`), así que el resultado es idéntico
+byte a byte al que se obtiene serializando la lista completa.
+"""
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Producto
+from schemas import ProductoResponse
+from cache import ResponseCache
+
+# Configuración
+PRODUCT_FRAGMENT_CACHE_SIZE = int(os.getenv("PRODUCT_FRAGMENT_CACHE_SIZE", "5000"))
+# Los fragmentos no quedan viejos (la clave incluye la versión): el TTL
+# solo libera memoria de productos que ya no se consultan
+PRODUCT_FRAGMENT_TTL = float(os.getenv("PRODUCT_FRAGMENT_TTL", "86400"))
+
+# producto_id => (clave de versión, fragmento JSON)
+fragment_cache = ResponseCache(maxsize=PRODUCT_FRAGMENT_CACHE_SIZE, ttl=PRODUCT_FRAGMENT_TTL)
+
+# Columnas que identifican la versión de un producto. fecha_creacion
+# distingue un producto nuevo que reutiliza el id de uno eliminado
+# (SQLite reutiliza el id más alto).
+COLUMNAS_VERSION = (Producto.id, Producto.version, Producto.fecha_creacion)
+
+VersionKey = Tuple
+Fila = Tuple  # (id, version, fecha_creacion)
+
+
+def _clave(version, fecha_creacion) -> VersionKey:
+    return (version, fecha_creacion.isoformat() if fecha_creacion is not None else None)
+
+
+def renderizar(producto: Producto) -> bytes:
+    """Serializa un producto y guarda el fragmento para su versión"""
+    fragmento = ProductoResponse.model_validate(producto).model_dump_json().encode()
+    fragment_cache.set(producto.id, (_clave(producto.version, producto.fecha_creacion), fragmento))
+    return fragmento
+
+
+def descartar(producto_id: int) -> None:
+    """Olvida el fragmento de un producto eliminado"""
+    fragment_cache.discard(producto_id)
+
+
+async def fragmentos_por_id(db: AsyncSession, filas: Sequence[Fila]) -> Dict[int, bytes]:
+    """
+    Fragmentos JSON de los productos de `filas` por id. Solo se cargan
+    desde la base (con sus imágenes) los productos cuyo fragmento no
+    está en el cache para esa versión; un producto eliminado entre las
+    dos consultas no aparece.
+    """
+    fragmentos: Dict[int, bytes] = {}
+    faltantes = []
+    for producto_id, version, fecha_creacion in filas:
+        guardado = fragment_cache.get(producto_id)
+        if guardado is not None and guardado[0] == _clave(version, fecha_creacion):
+            fragmentos[producto_id] = guardado[1]
+        else:
+            faltantes.append(producto_id)
+
+    if faltantes:
+        result = await db.execute(select(Producto).where(Producto.id.in_(faltantes)))
+        for producto in result.scalars().all():
+            fragmentos[producto.id] = renderizar(producto)
+    return fragmentos
+
+
+async def obtener_fragmentos(db: AsyncSession, filas: Sequence[Fila]) -> List[bytes]:
+    """Fragmentos JSON de los productos de `filas`, en el mismo orden"""
+    fragmentos = await fragmentos_por_id(db, filas)
+    return [fragmentos[fila[0]] for fila in filas if fila[0] in fragmentos]
+
+
+def lista_json(total: Optional[int], fragmentos: List[bytes], next_cursor: Optional[str] = None) -> bytes:
+    """
+    Cuerpo de `ProductoListResponse` armado con fragmentos ya
+    serializados (mismo formato que `model_dump_json`)
+    """
+    total_json = b"null" if total is None else str(total).encode()
+    cursor_json = b"null" if next_cursor is None else b'"' + next_cursor.encode() + b'"'
+    return (
+        b'{"total":' + total_json
+        + b',"productos":[' + b",".join(fragmentos)
+        + b'],"next_cursor":' + cursor_json + b"}"
+    )
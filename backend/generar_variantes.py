@@ -0,0 +1,61 @@
+"""
+Genera las variantes responsivas de las imágenes ya guardadas
+
+Uso:
+    python generar_variantes.py           # solo imágenes sin variantes
+    python generar_variantes.py --todas   # regenerar todas
+"""
+import asyncio
+import sys
+from sqlalchemy import select, update
+from database import AsyncSessionLocal, init_db
+from models import Producto, ImagenProducto
+from utils import process_image_url, image_path_from_url
+from image_pipeline import image_pipeline
+
+
+async def generar(todas: bool = False):
+    await init_db()
+    image_pipeline.start()
+    
+    async with AsyncSessionLocal() as db:
+        query = select(ImagenProducto).order_by(ImagenProducto.id)
+        if not todas:
+            query = query.where(ImagenProducto.variantes.is_(None))
+        result = await db.execute(query)
+        imagenes = [
+            imagen for imagen in result.scalars().all()
+            if image_path_from_url(imagen.url_imagen).exists()
+        ]
+        print(f"🖼️ {len(imagenes)} imagen(es) por procesar")
+        
+        # El original ya está optimizado: solo se generan las variantes
+        resultados = await asyncio.gather(*[
+            process_image_url(imagen.url_imagen, optimize_original=False, timeout=None)
+            for imagen in imagenes
+        ], return_exceptions=True)
+        
+        procesadas = 0
+        productos = set()
+        for imagen, variantes in zip(imagenes, resultados):
+            if isinstance(variantes, Exception):
+                print(f"❌ {imagen.url_imagen}: {variantes}")
+            elif variantes:
+                imagen.variantes = variantes
+                productos.add(imagen.producto_id)
+                procesadas += 1
+        if productos:
+            # Nueva versión: los workers descartan los fragmentos cacheados sin variantes
+            await db.execute(
+                update(Producto)
+                .where(Producto.id.in_(productos))
+                .values(version=Producto.version + 1)
+            )
+        await db.commit()
+    
+    await image_pipeline.shutdown()
+    print(f"✅ Variantes generadas para {procesadas} imagen(es)")
+
+
+if __name__ == "__main__":
+    asyncio.run(generar(todas="--todas" in sys.argv))
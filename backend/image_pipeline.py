@@ -0,0 +1,134 @@
+"""
+Procesamiento de imágenes fuera del event loop
+
+Las tareas pesadas (decodificar, redimensionar, re-codificar) se ejecutan
+en un pool de procesos. Una cola acotada limita cuántos trabajos pueden
+estar en curso: cuando está llena, las nuevas subidas esperan un tiempo
+máximo y luego reciben 503 en lugar de acumular memoria.
+"""
+import os
+import time
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, Set
+from fastapi import HTTPException
+from metrics import image_queue_wait, image_processing
+
+# Configuración
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))  # 0 = usar un hilo
+IMAGE_QUEUE_SIZE = int(os.getenv("IMAGE_QUEUE_SIZE", "16"))
+IMAGE_QUEUE_TIMEOUT = float(os.getenv("IMAGE_QUEUE_TIMEOUT", "10"))
+IMAGE_DRAIN_TIMEOUT = float(os.getenv("IMAGE_DRAIN_TIMEOUT", "30"))
+# Si es false, las subidas responden de inmediato con estado "pendiente"
+IMAGE_PROCESSING_WAIT = os.getenv("IMAGE_PROCESSING_WAIT", "true").lower() == "true"
+
+
+class ImagePipeline:
+    """
+    Pool de trabajadores con cola acotada para procesar imágenes
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._closing = False
+
+    def start(self) -> None:
+        """Crea el pool (se llama desde el startup de FastAPI)"""
+        self._closing = False
+        self._ensure_started()
+
+    def _ensure_started(self) -> None:
+        if self._executor is None:
+            if self.workers > 0:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.queue_size)
+
+    def is_full(self) -> bool:
+        """True si no quedan lugares libres en la cola"""
+        return self._closing or self._pending >= self.queue_size
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = IMAGE_QUEUE_TIMEOUT):
+        """
+        Ejecuta `func(*args)` en el pool y espera el resultado.
+        Con `timeout=None` espera un lugar en la cola sin límite.
+        """
+        # Durante el cierre se terminan los trabajos ya aceptados
+        if self._closing and self._executor is None:
+            raise HTTPException(status_code=503, detail="El servidor se está cerrando")
+        self._ensure_started()
+
+        self._pending += 1
+        inicio = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self._pending -= 1
+            raise HTTPException(
+                status_code=503,
+                detail="Hay demasiadas imágenes en proceso, intenta de nuevo en unos segundos",
+                headers={"Retry-After": "5"}
+            )
+
+        image_queue_wait.observe(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        except BrokenProcessPool:
+            # Un trabajador murió: se recrea el pool para las próximas tareas
+            self._executor = None
+            self._ensure_started()
+            raise
+        finally:
+            image_processing.observe(time.perf_counter() - inicio, getattr(func, "__name__", "tarea"))
+            self._pending -= 1
+            self._slots.release()
+
+    def spawn(self, coro) -> asyncio.Task:
+        """
+        Lanza una tarea en segundo plano que se espera al cerrar la app
+        """
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def shutdown(self, timeout: float = IMAGE_DRAIN_TIMEOUT) -> None:
+        """
+        Deja de aceptar trabajos, espera los que están en curso y cierra el pool
+        """
+        self._closing = True
+        if self._tasks:
+            print(f"⏳ Esperando {len(self._tasks)} imagen(es) en proceso...")
+            done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                print(f"⚠️ {len(pending)} imagen(es) quedaron sin procesar")
+
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown, True)
+        self._slots = None
+
+    def stats(self) -> dict:
+        """Estado actual de la cola"""
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self._pending,
+            "background": len(self._tasks),
+        }
+
+
+image_pipeline = ImagePipeline(workers=IMAGE_WORKERS, queue_size=IMAGE_QUEUE_SIZE)
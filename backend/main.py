@@ -1,18 +1,44 @@
 """
 Aplicación principal FastAPI
 """
-from fastapi import FastAPI
+import time
+_INICIO = time.perf_counter()
+
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 
-from database import init_db
-from routes import productos, auth
+from database import init_db, replica_router, engine
+from cache import catalog_cache
+from auth import token_cache
+from fragments import fragment_cache
+import metrics
+from compression import CompressionMiddleware
+from image_pipeline import image_pipeline
+from media import MediaFiles
+from static_export import static_exporter
+from outbox import outbox_worker
+from changes import change_log
+from media_gc import media_reclaimer
+from routes import productos, bulk, pedidos, auth
 
 load_dotenv()
 
+_IMPORTS = time.perf_counter()
+
+# Duración de cada etapa del arranque (ms), también visible en /health
+tiempos_arranque = {"imports": round((_IMPORTS - _INICIO) * 1000, 1)}
+
+
+def _medir(etapa: str, desde: float) -> float:
+    """Guarda el tiempo transcurrido desde `desde` para `etapa`"""
+    ahora = time.perf_counter()
+    tiempos_arranque[etapa] = round((ahora - desde) * 1000, 1)
+    return ahora
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -21,23 +47,47 @@ async def lifespan(app: FastAPI):
     """
     # Startup
     print("🚀 Iniciando aplicación...")
+    t = time.perf_counter()
     
     # Inicializar usuarios admin
     from auth import init_admin_users
     init_admin_users()
+    t = _medir("admin", t)
     
     await init_db()
     print("✅ Base de datos inicializada")
+    t = _medir("base_de_datos", t)
+    await replica_router.start()
+    t = _medir("replicas", t)
     
     # Crear directorio media si no existe
     media_path = os.getenv("MEDIA_PATH", "./media")
     os.makedirs(media_path, exist_ok=True)
     print(f"✅ Directorio media creado: {media_path}")
     
+    image_pipeline.start()
+    print(f"✅ Pool de imágenes iniciado ({image_pipeline.workers} trabajador(es))")
+    reanudadas = await productos.reanudar_imagenes_pendientes()
+    if reanudadas:
+        print(f"🔁 {reanudadas} imagen(es) pendiente(s) encolada(s) de nuevo")
+    t = _medir("imagenes", t)
+    media_reclaimer.start()
+    static_exporter.start()
+    outbox_worker.start()
+    
+    tiempos_arranque["total"] = round((t - _INICIO) * 1000, 1)
+    detalle = ", ".join(f"{etapa} {ms} ms" for etapa, ms in tiempos_arranque.items() if etapa != "total")
+    print(f"⏱️ Arranque en {tiempos_arranque['total']} ms ({detalle})")
+    
     yield
     
     # Shutdown
     print("👋 Cerrando aplicación...")
+    await outbox_worker.shutdown()
+    await static_exporter.shutdown()
+    await image_pipeline.shutdown()
+    await media_reclaimer.shutdown()
+    await replica_router.shutdown()
 
 
 # Crear aplicación
@@ -77,15 +127,24 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+# Compresión brotli/gzip (las respuestas del cache ya vienen comprimidas)
+app.add_middleware(CompressionMiddleware)
+
+# Métricas: el middleware más externo mide la petición completa
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Registrar rutas ANTES de montar archivos estáticos
 app.include_router(auth.router)
+# bulk va antes que productos: /productos/export no debe tomarse como /{producto_id}
+app.include_router(bulk.router)
 app.include_router(productos.router)
+app.include_router(pedidos.router)
 
 # Montar directorio de archivos estáticos AL FINAL (crear si no existe)
 media_path = os.getenv("MEDIA_PATH", "./media")
 os.makedirs(media_path, exist_ok=True)  # Crear directorio antes de montar
 try:
-    app.mount("/media", StaticFiles(directory=media_path), name="media")
+    app.mount("/media", MediaFiles(directory=media_path), name="media")
     print(f"✅ Directorio media montado: {media_path}")
 except Exception as e:
     print(f"⚠️ No se pudo montar directorio media: {e}")
@@ -109,7 +168,72 @@ async def health_check():
     """
     Health check
     """
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "cache": catalog_cache.stats(),
+        "imagenes": image_pipeline.stats(),
+        "archivos_liberados": media_reclaimer.stats(),
+        "base_de_datos": replica_router.stats(),
+        "outbox": outbox_worker.stats(),
+        "cambios": change_log.stats(),
+        "arranque_ms": tiempos_arranque
+    }
+
+
+def _estadisticas_cache() -> dict:
+    return {
+        "catalogo": catalog_cache.stats(),
+        "tokens": token_cache.stats(),
+        "fragmentos": fragment_cache.stats(),
+    }
+
+
+def _conexiones_en_uso() -> dict:
+    engines = {"primario": engine}
+    engines.update({replica.etiqueta: replica.engine for replica in replica_router.replicas})
+    return {
+        (nombre, ): motor.pool.checkedout()
+        for nombre, motor in engines.items() if hasattr(motor.pool, "checkedout")
+    }
+
+
+metrics.Counter(
+    "cache_hits_total", "Aciertos del cache en memoria", ("cache",),
+    lambda: {(nombre,): stats["hits"] for nombre, stats in _estadisticas_cache().items()}
+)
+metrics.Counter(
+    "cache_misses_total", "Fallos del cache en memoria", ("cache",),
+    lambda: {(nombre,): stats["misses"] for nombre, stats in _estadisticas_cache().items()}
+)
+metrics.Gauge(
+    "cache_hit_ratio", "Proporción de aciertos del cache en memoria", ("cache",),
+    lambda: {(nombre,): stats["hit_ratio"] for nombre, stats in _estadisticas_cache().items()}
+)
+metrics.Gauge(
+    "cache_entries", "Entradas guardadas en el cache en memoria", ("cache",),
+    lambda: {(nombre,): stats["entries"] for nombre, stats in _estadisticas_cache().items()}
+)
+metrics.Gauge(
+    "db_pool_checked_out", "Conexiones del pool en uso", ("database",), _conexiones_en_uso
+)
+metrics.Gauge(
+    "image_jobs_in_flight", "Trabajos de imágenes en curso o en espera", (),
+    lambda: {(): image_pipeline.stats()["in_flight"]}
+)
+metrics.Gauge(
+    "changes_stream_clients", "Clientes conectados a /productos/changes", (),
+    lambda: {(): change_log.clientes}
+)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    """
+    Métricas en formato de texto de Prometheus
+    """
+    if metrics.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Token de métricas inválido")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,168 @@
+"""
+Servidor de archivos media (/media) con cache HTTP y negociación de formato
+
+- Las URLs direccionadas por contenido (productos/sha256/...) o con
+  versión (?v=...) nunca cambian: se envían como `immutable` por un año.
+- El resto se cachea por MEDIA_MAX_AGE segundos y se revalida con ETag.
+- Si el navegador acepta AVIF/WebP (listado en Accept, con q > 0 y no
+  menor que el del formato original) y existe una variante precalculada
+  de la imagen pedida en ese formato, se envía esa (con `Vary: Accept`).
+  Un comodín (`*/*`, `image/*`) no basta: lo envían también navegadores
+  que no decodifican AVIF.
+- Range, If-None-Match y el envío del archivo sin copias (extensión ASGI
+  `http.response.pathsend`, si el servidor la soporta) los resuelve
+  FileResponse de Starlette.
+"""
+import os
+import re
+import time
+import mimetypes
+from typing import Dict, List, Optional, Tuple
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from starlette.types import Scope
+
+# Configuración
+MEDIA_MAX_AGE = int(os.getenv("MEDIA_MAX_AGE", "86400"))
+# Formatos alternativos en orden de preferencia
+MEDIA_NEGOTIATED_FORMATS = [
+    f.strip() for f in os.getenv("MEDIA_NEGOTIATED_FORMATS", "avif,webp").split(",") if f.strip()
+]
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+NEGOTIABLE_EXTENSIONS = {"jpg", "jpeg", "png"}
+# productos/sha256/ab/<hash>.<ext> o sus variantes <hash>_w480.<ext>
+CONTENT_ADDRESSED = re.compile(r"(^|/)productos/sha256/[0-9a-f]{2}/[0-9a-f]{64}(_w\d+)?\.\w+$")
+NEGATIVE_TTL = 60
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+
+def _calidades(accept: str) -> Dict[str, float]:
+    """Tipos de un header Accept con su q (sin q = 1)"""
+    calidades = {}
+    for parte in accept.lower().split(","):
+        tipo, *parametros = parte.split(";")
+        q = 1.0
+        for parametro in parametros:
+            nombre, _, valor = parametro.strip().partition("=")
+            if nombre == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        if tipo.strip():
+            calidades[tipo.strip()] = q
+    return calidades
+
+
+def formatos_aceptados(accept: str, ext: str) -> List[str]:
+    """
+    Formatos de MEDIA_NEGOTIATED_FORMATS que se pueden enviar en lugar
+    del original `ext`, de mayor a menor preferencia
+    """
+    calidades = _calidades(accept)
+    original = mimetypes.types_map.get(f".{ext}", f"image/{ext}")
+    q_original = calidades.get(original, calidades.get("image/*", calidades.get("*/*", 0.0)))
+    candidatos = [
+        (calidades[f"image/{formato}"], -orden, formato)
+        for orden, formato in enumerate(MEDIA_NEGOTIATED_FORMATS)
+        if calidades.get(f"image/{formato}", 0.0) > 0 and calidades[f"image/{formato}"] >= q_original
+    ]
+    return [formato for _, _, formato in sorted(candidatos, reverse=True)]
+
+
+class MediaFiles(StaticFiles):
+    """
+    StaticFiles con Cache-Control por tipo de URL y negociación por Accept
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (ruta, formato) => (ruta alternativa o None, expiración)
+        self._alternatives: Dict[Tuple[str, str], Tuple[Optional[str], float]] = {}
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        ext = path.rsplit(".", 1)[-1].lower() if "." in path else ""
+        if ext in NEGOTIABLE_EXTENSIONS and scope["method"] in ("GET", "HEAD"):
+            accept = Headers(scope=scope).get("accept", "")
+            for formato in formatos_aceptados(accept, ext):
+                alternative = await self._alternative(path, formato)
+                if alternative is None:
+                    continue
+                try:
+                    return await super().get_response(alternative, scope)
+                except HTTPException:
+                    # La variante se eliminó: se olvida y se sirve el original
+                    self._alternatives.pop((path, formato), None)
+
+        return await super().get_response(path, scope)
+
+    async def _alternative(self, path: str, formato: str) -> Optional[str]:
+        """
+        Ruta de la variante precalculada de `path` en `formato`, si existe.
+        Los resultados se recuerdan (los negativos solo NEGATIVE_TTL segundos).
+        """
+        key = (path, formato)
+        cached = self._alternatives.get(key)
+        if cached is not None and (cached[0] is not None or cached[1] > time.monotonic()):
+            return cached[0]
+
+        alternative = await anyio.to_thread.run_sync(self._find_alternative, path, formato)
+        if len(self._alternatives) > 4096:
+            self._alternatives.clear()
+        self._alternatives[key] = (alternative, time.monotonic() + NEGATIVE_TTL)
+        return alternative
+
+    def _find_alternative(self, path: str, formato: str) -> Optional[str]:
+        stem, _ = os.path.splitext(path)
+        sibling = f"{stem}.{formato}"
+        if self.lookup_path(sibling)[1] is not None:
+            return sibling
+
+        # Para el original se usa la variante más ancha (mismo tamaño final)
+        full_path, stat_result = self.lookup_path(path)
+        if stat_result is None:
+            return None
+        directory, name = os.path.split(full_path)
+        prefix = os.path.splitext(name)[0] + "_w"
+        best, best_width = None, -1
+        for candidate in os.listdir(directory):
+            candidate_stem, candidate_ext = os.path.splitext(candidate)
+            if candidate_ext != f".{formato}" or not candidate_stem.startswith(prefix):
+                continue
+            width = candidate_stem[len(prefix):]
+            if width.isdigit() and int(width) > best_width:
+                best, best_width = candidate, int(width)
+        if best is None:
+            return None
+        return os.path.join(os.path.dirname(path), best)
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        requested = scope["path"]
+
+        query = scope.get("query_string", b"").decode()
+        versioned = any(part.startswith("v=") for part in query.split("&"))
+        if CONTENT_ADDRESSED.search(requested) or versioned:
+            cache_control = IMMUTABLE
+        else:
+            cache_control = f"public, max-age={MEDIA_MAX_AGE}"
+        headers = {"Cache-Control": cache_control}
+        if requested.rsplit(".", 1)[-1].lower() in NEGOTIABLE_EXTENSIONS:
+            headers["Vary"] = "Accept"
+
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
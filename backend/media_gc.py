@@ -0,0 +1,371 @@
+"""
+Limpieza de archivos de imágenes sin referencias
+
+- `media_reclaimer.liberar(...)`: las rutas lo llaman después del commit
+  con los archivos que quizá quedaron sin uso. Un proceso en segundo
+  plano vuelve a revisar las referencias en `imagenes_productos` y borra
+  los archivos en un hilo, así la latencia de las rutas no depende del disco.
+  Un archivo modificado después de liberarse (una subida que lo reutiliza
+  y aún no hace commit) se conserva.
+- `reconciliar(...)`: recorre MEDIA_PATH/productos/ y compara con
+  `imagenes_productos` por lotes: reporta (o elimina) archivos huérfanos
+  y filas cuyo archivo ya no existe.
+
+Uso:
+    python media_gc.py              # solo reporta
+    python media_gc.py --eliminar   # elimina huérfanos y filas sin archivo
+    python media_gc.py --lote 200
+
+Los archivos modificados hace menos de MEDIA_GC_GRACE segundos nunca se
+consideran huérfanos (pueden ser de una subida que aún no hace commit).
+"""
+import os
+import re
+import sys
+import time
+import asyncio
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import select, update, delete
+from database import AsyncSessionLocal
+from models import Producto, ImagenProducto
+from cache import catalog_cache
+from changes import change_log
+from utils import (
+    MEDIA_PATH,
+    PENDING_SUFFIX,
+    image_path_from_url,
+    delete_image,
+    delete_product_images,
+)
+import metrics
+
+# Configuración
+MEDIA_GC_BATCH_SIZE = int(os.getenv("MEDIA_GC_BATCH_SIZE", "500"))  # archivos o filas por consulta
+MEDIA_GC_GRACE = float(os.getenv("MEDIA_GC_GRACE", "3600"))  # segundos
+MEDIA_RECONCILE_INTERVAL = float(os.getenv("MEDIA_RECONCILE_INTERVAL", "0"))  # horas, 0 = desactivado
+MEDIA_RECONCILE_DELETE = os.getenv("MEDIA_RECONCILE_DELETE", "false").lower() == "true"
+
+# Variantes generadas por `process_image`: {original}_w{ancho}.{formato}
+_VARIANTE = re.compile(r"^(?P<original>.+)_w\d+\.[A-Za-z0-9]+$")
+
+
+def _url(ruta: Path) -> str:
+    return "/media/" + ruta.relative_to(MEDIA_PATH).as_posix()
+
+
+async def urls_sin_referencias(urls: List[str]) -> List[str]:
+    """URLs que ya no usa ningún registro de imagenes_productos"""
+    if not urls:
+        return []
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(ImagenProducto.url_imagen)
+            .where(ImagenProducto.url_imagen.in_(urls))
+            .distinct()
+        )
+        en_uso = set(result.scalars().all())
+    return [url for url in urls if url not in en_uso]
+
+
+def _eliminar(urls: Dict[str, float], productos: Iterable[int] = ()) -> int:
+    """
+    Borra archivos liberados ({url: momento de liberar}) salvo que se
+    hayan vuelto a usar después, y directorios de productos (se ejecuta
+    en un hilo). Retorna cuántos archivos se borraron.
+    """
+    for producto_id in productos:
+        delete_product_images(producto_id)
+    eliminados = 0
+    for url, liberado in urls.items():
+        ruta = image_path_from_url(url)
+        try:
+            if ruta.stat().st_mtime > liberado:
+                continue
+        except OSError:
+            pass
+        delete_image(url)
+        eliminados += 1
+    return eliminados
+
+
+def _eliminar_huerfanos(urls: Iterable[str], limite: float) -> int:
+    """
+    Borra originales huérfanos (y sus variantes) salvo que se hayan
+    vuelto a escribir después de `limite` (se ejecuta en un hilo)
+    """
+    eliminados = 0
+    for url in urls:
+        try:
+            if image_path_from_url(url).stat().st_mtime > limite:
+                continue
+        except OSError:
+            continue
+        delete_image(url)
+        eliminados += 1
+    return eliminados
+
+
+class MediaReclaimer:
+    """
+    Borra en segundo plano los archivos liberados por las rutas, después
+    de comprobar que ningún registro los sigue usando
+    """
+
+    def __init__(self, batch_size: int = MEDIA_GC_BATCH_SIZE):
+        self.batch_size = max(1, batch_size)
+        self.eliminados = 0
+        self._urls: Dict[str, float] = {}  # url => momento en que se liberó
+        self._productos: set = set()
+        self._despertar: Optional[asyncio.Event] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self._reconciliacion: Optional[asyncio.Task] = None
+
+    def liberar(self, urls: Iterable[str] = (), producto_id: Optional[int] = None) -> None:
+        """
+        Programa la eliminación de archivos que quizá quedaron sin
+        referencias y, con `producto_id`, del directorio del formato
+        anterior (/media/productos/{id}/). Se llama después del commit.
+        
+        Un archivo que se vuelve a usar después (ver `touch_image`) no
+        se borra aunque su registro aún no esté confirmado.
+        """
+        liberado = time.time()
+        for url in urls:
+            self._urls[url] = liberado
+        if producto_id is not None:
+            self._productos.add(producto_id)
+        if self._despertar is not None:
+            self._despertar.set()
+
+    async def procesar_pendientes(self) -> int:
+        """Borra los archivos liberados sin referencias. Retorna cuántos se borraron."""
+        eliminados = 0
+        while self._urls or self._productos:
+            productos, self._productos = self._productos, set()
+            lote = dict(self._urls.popitem() for _ in range(min(len(self._urls), self.batch_size)))
+            sin_uso = await urls_sin_referencias(list(lote))
+            borrados = await asyncio.to_thread(_eliminar, {url: lote[url] for url in sin_uso}, productos)
+            eliminados += borrados
+            metrics.media_files_reclaimed.inc("liberado", amount=borrados)
+        self.eliminados += eliminados
+        return eliminados
+
+    async def _ciclo(self) -> None:
+        while True:
+            self._despertar.clear()
+            try:
+                await self.procesar_pendientes()
+            except Exception as e:
+                # Lo que quede sin borrar lo encuentra `reconciliar`
+                print(f"❌ Error liberando archivos de imágenes: {e}")
+            await self._despertar.wait()
+
+    async def _reconciliar_periodicamente(self) -> None:
+        while True:
+            await asyncio.sleep(MEDIA_RECONCILE_INTERVAL * 3600)
+            try:
+                await reconciliar(eliminar=MEDIA_RECONCILE_DELETE, lote=self.batch_size)
+            except Exception as e:
+                print(f"❌ Error reconciliando archivos de imágenes: {e}")
+
+    def start(self) -> None:
+        self._despertar = asyncio.Event()
+        self._tarea = asyncio.create_task(self._ciclo())
+        if MEDIA_RECONCILE_INTERVAL > 0:
+            self._reconciliacion = asyncio.create_task(self._reconciliar_periodicamente())
+            print(f"✅ Reconciliación de imágenes cada {MEDIA_RECONCILE_INTERVAL:g} h")
+        if self._urls or self._productos:
+            self._despertar.set()
+
+    async def shutdown(self) -> None:
+        """Detiene los procesos y borra lo que quedó liberado"""
+        for tarea in (self._tarea, self._reconciliacion):
+            if tarea is None:
+                continue
+            tarea.cancel()
+            try:
+                await tarea
+            except asyncio.CancelledError:
+                pass
+        self._tarea = self._reconciliacion = None
+        self._despertar = None
+        try:
+            await self.procesar_pendientes()
+        except Exception as e:
+            print(f"⚠️ {len(self._urls)} archivo(s) quedaron sin liberar: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "pendientes": len(self._urls) + len(self._productos),
+            "eliminados": self.eliminados,
+        }
+
+
+media_reclaimer = MediaReclaimer()
+
+
+def _recorrer(raiz: Path, limite: float) -> Iterator[Tuple[Dict[str, int], List[Tuple[Path, int]]]]:
+    """
+    Recorre los directorios de imágenes. Por cada directorio entrega los
+    originales anteriores a `limite` ({url: bytes}) y los archivos sueltos
+    que se pueden borrar sin consultar la base: variantes cuyo original
+    no existe y temporales `.part` abandonados.
+    """
+    for directorio, _, archivos in os.walk(raiz):
+        directorio = Path(directorio)
+        nombres = [(nombre, directorio / nombre) for nombre in archivos]
+        originales_presentes = {
+            Path(nombre).stem for nombre, _ in nombres
+            if not nombre.startswith(".") and not _VARIANTE.match(nombre)
+        }
+        originales, sueltos = {}, []
+        for nombre, ruta in nombres:
+            try:
+                estado = ruta.stat()
+            except OSError:
+                continue
+            if estado.st_mtime > limite:
+                continue
+            if nombre.startswith("."):
+                if nombre.endswith(".part"):
+                    sueltos.append((ruta, estado.st_size))
+                continue
+            variante = _VARIANTE.match(nombre)
+            if variante is None:
+                originales[_url(ruta)] = estado.st_size
+            elif variante.group("original") not in originales_presentes:
+                sueltos.append((ruta, estado.st_size))
+        yield originales, sueltos
+
+
+def _borrar_sueltos(sueltos: List[Tuple[Path, int]]) -> None:
+    for ruta, _ in sueltos:
+        try:
+            ruta.unlink()
+        except OSError as e:
+            print(f"Error eliminando {ruta}: {e}")
+
+
+def _existe(imagen: Tuple[int, int, str, str]) -> bool:
+    """Si el archivo de una fila existe (una imagen pendiente puede estar ya en su URL final)"""
+    _, _, url, estado = imagen
+    if image_path_from_url(url).exists():
+        return True
+    return estado == "pendiente" and image_path_from_url(url.replace(PENDING_SUFFIX, "", 1)).exists()
+
+
+async def _revisar_archivos(originales: Dict[str, int], eliminar: bool, limite: float, reporte: dict) -> None:
+    """Busca en la base un lote de originales y reporta o borra los huérfanos"""
+    huerfanos = await urls_sin_referencias(list(originales))
+    for url in huerfanos:
+        print(f"🗑️ Archivo huérfano: {url} ({originales[url]} bytes)")
+    reporte["archivos_huerfanos"] += len(huerfanos)
+    reporte["bytes_huerfanos"] += sum(originales[url] for url in huerfanos)
+    if eliminar and huerfanos:
+        eliminados = await asyncio.to_thread(_eliminar_huerfanos, huerfanos, limite)
+        reporte["archivos_eliminados"] += eliminados
+        metrics.media_files_reclaimed.inc("reconciliacion", amount=eliminados)
+
+
+async def _revisar_filas(lote: int, eliminar: bool, reporte: dict) -> None:
+    """Recorre imagenes_productos por lotes buscando filas sin archivo"""
+    ultimo = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ImagenProducto.id, ImagenProducto.producto_id, ImagenProducto.url_imagen, ImagenProducto.estado)
+                .where(ImagenProducto.id > ultimo)
+                .order_by(ImagenProducto.id)
+                .limit(lote)
+            )
+            imagenes = [tuple(fila) for fila in result.all()]
+            if not imagenes:
+                return
+            ultimo = imagenes[-1][0]
+            reporte["filas"] += len(imagenes)
+
+            existen = await asyncio.to_thread(lambda: [_existe(imagen) for imagen in imagenes])
+            sin_archivo = [imagen for imagen, existe in zip(imagenes, existen) if not existe]
+            for imagen_id, producto_id, url, _ in sin_archivo:
+                print(f"🔗 Imagen {imagen_id} del producto {producto_id} sin archivo: {url}")
+            reporte["filas_sin_archivo"] += len(sin_archivo)
+
+            if eliminar and sin_archivo:
+                productos = sorted({imagen[1] for imagen in sin_archivo})
+                await db.execute(
+                    delete(ImagenProducto).where(ImagenProducto.id.in_([imagen[0] for imagen in sin_archivo]))
+                )
+                await db.execute(
+                    update(Producto)
+                    .where(Producto.id.in_(productos))
+                    .values(version=Producto.version + 1)
+                )
+                await db.commit()
+                catalog_cache.invalidate()
+                change_log.publicar("imagenes.actualizadas", producto_ids=productos)
+                reporte["filas_eliminadas"] += len(sin_archivo)
+
+
+async def reconciliar(
+    eliminar: bool = False,
+    lote: int = MEDIA_GC_BATCH_SIZE,
+    gracia: float = MEDIA_GC_GRACE
+) -> dict:
+    """
+    Compara MEDIA_PATH/productos/ con imagenes_productos en lotes de
+    `lote` archivos o filas. Con `eliminar=False` solo reporta.
+    """
+    lote = max(1, lote)
+    limite = time.time() - gracia
+    reporte = {
+        "archivos": 0,
+        "archivos_huerfanos": 0,
+        "bytes_huerfanos": 0,
+        "archivos_eliminados": 0,
+        "sueltos": 0,
+        "filas": 0,
+        "filas_sin_archivo": 0,
+        "filas_eliminadas": 0,
+    }
+
+    raiz = Path(MEDIA_PATH) / "productos"
+    directorios = _recorrer(raiz, limite)
+    pendientes: Dict[str, int] = {}
+    while True:
+        bloque = await asyncio.to_thread(next, directorios, None)
+        if bloque is not None:
+            originales, sueltos = bloque
+            reporte["archivos"] += len(originales)
+            pendientes.update(originales)
+            if sueltos:
+                reporte["sueltos"] += len(sueltos)
+                if eliminar:
+                    await asyncio.to_thread(_borrar_sueltos, sueltos)
+        while len(pendientes) >= lote or (bloque is None and pendientes):
+            urls = list(pendientes)[:lote]
+            await _revisar_archivos({url: pendientes.pop(url) for url in urls}, eliminar, limite, reporte)
+        if bloque is None:
+            break
+
+    await _revisar_filas(lote, eliminar, reporte)
+    print(
+        f"🧹 Reconciliación de imágenes: {reporte['archivos_huerfanos']} huérfano(s) de "
+        f"{reporte['archivos']} archivo(s), {reporte['sueltos']} suelto(s), "
+        f"{reporte['filas_sin_archivo']} fila(s) sin archivo de {reporte['filas']}"
+        + (" (eliminados)" if eliminar else "")
+    )
+    return reporte
+
+
+async def main(eliminar: bool, lote: int):
+    from database import init_db
+    await init_db()
+    await reconciliar(eliminar=eliminar, lote=lote)
+
+
+if __name__ == "__main__":
+    lote = MEDIA_GC_BATCH_SIZE
+    if "--lote" in sys.argv:
+        lote = int(sys.argv[sys.argv.index("--lote") + 1])
+    asyncio.run(main("--eliminar" in sys.argv, lote))
@@ -0,0 +1,275 @@
+"""
+Métricas en formato de texto de Prometheus (/metrics)
+
+Contadores, histogramas y gauges mínimos, sin dependencias externas.
+Los valores son por proceso: con varios workers de Gunicorn cada uno
+expone los suyos.
+"""
+import os
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Configuración
+# Si se define, /metrics exige "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Segundos: de 1 ms a 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pares = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Base: nombre, ayuda y nombres de etiquetas"""
+    tipo = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        registry.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.tipo}"]
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Valor que solo crece. Con `funcion` se lee de un contador que ya
+    existe (por ejemplo los aciertos de un cache) al exponer las
+    métricas: debe retornar {(valores de etiquetas...): valor}.
+    """
+    tipo = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        funcion: Optional[Callable[[], Dict[LabelValues, float]]] = None
+    ):
+        super().__init__(name, help, labels)
+        self.funcion = funcion
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        values = self.funcion() if self.funcion is not None else self._values
+        return [
+            f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+            for key, value in values.items()
+        ]
+
+
+class Histogram(Metric):
+    """Distribución de observaciones en buckets acumulados"""
+    tipo = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas => [conteo por bucket..., suma, total]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        data = self._values.get(labels)
+        if data is None:
+            data = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, limite in enumerate(self.buckets):
+            if value <= limite:
+                data[i] += 1
+                break
+        data[-2] += value
+        data[-1] += 1
+
+    def collect(self) -> List[str]:
+        lineas = []
+        for key, data in self._values.items():
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, data):
+                acumulado += conteo
+                le = f'le="{_number(limite)}"'
+                lineas.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {acumulado}")
+            inf = 'le="+Inf"'
+            lineas.append(f"{self.name}_bucket{_labels(self.labels, key, inf)} {data[-1]}")
+            lineas.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(data[-2])}")
+            lineas.append(f"{self.name}_count{_labels(self.labels, key)} {data[-1]}")
+        return lineas
+
+
+class Gauge(Metric):
+    """
+    Valor instantáneo. Con `funcion` se calcula al exponer las métricas:
+    debe retornar {(valores de etiquetas...): valor}.
+    """
+    tipo = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        funcion: Optional[Callable[[], Dict[LabelValues, float]]] = None
+    ):
+        super().__init__(name, help, labels)
+        self.funcion = funcion
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def collect(self) -> List[str]:
+        values = self.funcion() if self.funcion is not None else self._values
+        return [
+            f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+            for key, value in values.items()
+        ]
+
+
+registry: List[Metric] = []
+
+
+def render() -> str:
+    """Todas las métricas en formato de texto de Prometheus"""
+    lineas = []
+    for metric in registry:
+        try:
+            valores = metric.collect()
+        except Exception as e:
+            print(f"⚠️ Error calculando la métrica {metric.name}: {e}")
+            continue
+        lineas.extend(metric.header())
+        lineas.extend(valores)
+    return "\n".join(lineas) + "\n"
+
+
+# Métricas de la aplicación
+http_requests = Counter(
+    "http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status")
+)
+http_duration = Histogram(
+    "http_request_duration_seconds", "Duración de las peticiones HTTP", ("method", "route")
+)
+db_queries = Counter(
+    "db_queries_total", "Consultas SQL ejecutadas", ("database",)
+)
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "Duración de cada consulta SQL", ("database",)
+)
+db_request_queries = Histogram(
+    "db_queries_per_request", "Consultas SQL por petición", ("route",), buckets=COUNT_BUCKETS
+)
+db_request_duration = Histogram(
+    "db_request_query_seconds", "Tiempo total en consultas SQL por petición", ("route",)
+)
+db_pool_wait = Histogram(
+    "db_pool_checkout_seconds", "Espera para obtener una conexión del pool", ("database",)
+)
+image_queue_wait = Histogram(
+    "image_queue_wait_seconds", "Espera de un lugar en la cola de imágenes"
+)
+image_processing = Histogram(
+    "image_processing_seconds", "Duración del procesamiento de imágenes en el pool", ("task",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+image_bytes_saved = Counter(
+    "image_bytes_saved_total", "Bytes ahorrados al optimizar imágenes originales"
+)
+outbox_deliveries = Counter(
+    "outbox_deliveries_total", "Entregas de eventos del outbox por resultado", ("resultado",)
+)
+media_files_reclaimed = Counter(
+    "media_files_reclaimed_total", "Archivos de imágenes sin referencias eliminados", ("origen",)
+)
+
+
+# Consultas de la petición en curso: [cantidad, segundos]
+_consultas_peticion: ContextVar[Optional[List[float]]] = ContextVar("consultas_peticion", default=None)
+
+
+def registrar_consulta(database: str, duration: float) -> None:
+    """Se llama desde los eventos del motor después de cada consulta"""
+    db_queries.inc(database)
+    db_query_duration.observe(duration, database)
+    consultas = _consultas_peticion.get()
+    if consultas is not None:
+        consultas[0] += 1
+        consultas[1] += duration
+
+
+def _ruta(scope) -> str:
+    """Plantilla de la ruta (/productos/{producto_id}) para no crear una serie por URL"""
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    path = scope.get("path", "")
+    if path.startswith("/media/"):
+        return "/media"
+    return "sin_ruta"
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: cuenta peticiones, mide su duración y las consultas
+    SQL que hizo cada una
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        consultas = [0, 0.0]
+        token = _consultas_peticion.set(consultas)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _consultas_peticion.reset(token)
+            ruta = _ruta(scope)
+            method = scope.get("method", "")
+            http_requests.inc(method, ruta, str(status["code"]))
+            http_duration.observe(time.perf_counter() - inicio, method, ruta)
+            if ruta != "/media":
+                db_request_queries.observe(consultas[0], ruta)
+                db_request_duration.observe(consultas[1], ruta)
@@ -1,7 +1,7 @@
 """
 Modelos de base de datos
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -21,10 +21,20 @@ class Producto(Base):
     fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
     fecha_actualizacion = Column(DateTime(timezone=True), onupdate=func.now())
     disponible = Column(Integer, default=1)  # 1 = disponible, 0 = no disponible
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Se incrementa en cada cambio
     
     # Relación con imágenes
     imagenes = relationship("ImagenProducto", back_populates="producto", cascade="all, delete-orphan", lazy="selectin")
     
+    # Índices para paginación por cursor (orden estable por id) y para
+    # los filtros de precio y los órdenes del listado
+    __table_args__ = (
+        Index("ix_productos_categoria_id", "categoria", "id"),
+        Index("ix_productos_disponible_id", "disponible", "id"),
+        Index("ix_productos_categoria_disponible_precio", "categoria", "disponible", "precio"),
+        Index("ix_productos_disponible_fecha_creacion", "disponible", "fecha_creacion"),
+    )
+    
     def __repr__(self):
         return f"<Producto {self.nombre}>"
 
@@ -37,8 +47,11 @@ class ImagenProducto(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     producto_id = Column(Integer, ForeignKey("productos.id", ondelete="CASCADE"), nullable=False)
-    url_imagen = Column(String(500), nullable=False)
+    url_imagen = Column(String(500), nullable=False, index=True)
+    hash_contenido = Column(String(64), nullable=True, index=True)  # sha256 del archivo subido
     orden = Column(Integer, default=0)  # Para ordenar las imágenes
+    estado = Column(String(20), default="lista")  # pendiente | lista | error
+    variantes = Column(JSON(none_as_null=True), nullable=True)  # [{"ancho", "formato", "url"}, ...]
     fecha_subida = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relación con producto
@@ -47,3 +60,52 @@ class ImagenProducto(Base):
     def __repr__(self):
         return f"<ImagenProducto {self.url_imagen}>"
 
+
+class Pedido(Base):
+    """
+    Modelo de Pedido
+    """
+    __tablename__ = "pedidos"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cliente_nombre = Column(String(200), nullable=False)
+    cliente_telefono = Column(String(50), nullable=False)
+    cliente_direccion = Column(String(500), nullable=False)
+    cliente_email = Column(String(200), nullable=True)
+    productos = Column(JSON, nullable=False)  # [{"id", "nombre", "precio", "cantidad", ...}, ...]
+    total = Column(Float, nullable=False)
+    observaciones = Column(Text, nullable=True)
+    estado = Column(String(20), default="pendiente")
+    clave_idempotencia = Column(String(100), nullable=True, unique=True)  # Header Idempotency-Key del cliente
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<Pedido {self.id}>"
+
+
+class OutboxEvento(Base):
+    """
+    Evento pendiente de notificar (patrón outbox): se guarda en la misma
+    transacción que el cambio que lo origina y un proceso en segundo
+    plano lo entrega
+    """
+    __tablename__ = "outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String(50), nullable=False)  # pedido.creado
+    payload = Column(JSON, nullable=False)
+    clave_idempotencia = Column(String(64), nullable=False, unique=True)  # Idempotency-Key al entregar
+    estado = Column(String(20), nullable=False, default="pendiente")  # pendiente | enviado | fallido
+    intentos = Column(Integer, nullable=False, default=0)
+    proximo_intento = Column(DateTime(timezone=True), nullable=False)
+    ultimo_error = Column(Text, nullable=True)
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
+    fecha_envio = Column(DateTime(timezone=True), nullable=True)
+    
+    # Eventos por entregar, en orden
+    __table_args__ = (
+        Index("ix_outbox_estado_proximo_intento", "estado", "proximo_intento"),
+    )
+    
+    def __repr__(self):
+        return f"<OutboxEvento {self.tipo} {self.id}>"
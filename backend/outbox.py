@@ -0,0 +1,222 @@
+"""
+Entrega de eventos del outbox (notificaciones de pedidos a n8n)
+
+Los eventos se guardan en la tabla `outbox` en la misma transacción que
+el pedido, así que un webhook lento o caído no bloquea ni pierde
+pedidos. Un proceso en segundo plano los entrega por lotes con
+reintentos y espera exponencial; cada evento lleva una
+`Idempotency-Key` fija para que el receptor descarte duplicados.
+
+Con varios workers de Gunicorn cada uno reclama su lote: en PostgreSQL
+con `FOR UPDATE SKIP LOCKED` y en todos los motores con un plazo
+(`proximo_intento`) que evita que otro worker tome el mismo evento
+mientras se entrega.
+"""
+import os
+import uuid
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import select, update
+from database import AsyncSessionLocal
+from models import OutboxEvento
+import metrics
+
+# Configuración
+N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))  # segundos
+OUTBOX_TIMEOUT = float(os.getenv("OUTBOX_TIMEOUT", "10"))  # segundos por entrega
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))  # segundos
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "900"))  # segundos
+
+# Tiempo que un evento reclamado queda reservado para el worker que lo entrega
+OUTBOX_LEASE = max(30.0, OUTBOX_TIMEOUT * 3)
+
+# (id, tipo, payload, clave de idempotencia, intentos previos)
+Reclamado = Tuple[int, str, dict, str, int]
+
+
+def ahora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def nuevo_evento(tipo: str, payload: dict) -> OutboxEvento:
+    """Evento listo para agregarse a la sesión de la transacción que lo origina"""
+    return OutboxEvento(
+        tipo=tipo,
+        payload=payload,
+        clave_idempotencia=uuid.uuid4().hex,
+        estado="pendiente",
+        intentos=0,
+        proximo_intento=ahora()
+    )
+
+
+def backoff(intentos: int) -> float:
+    """Segundos hasta el siguiente intento: exponencial con jitter"""
+    espera = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** max(intentos - 1, 0))
+    return espera * random.uniform(0.5, 1.0)
+
+
+class OutboxWorker:
+    """
+    Entrega por lotes los eventos pendientes del outbox a un webhook
+    """
+
+    def __init__(
+        self,
+        url: str = N8N_WEBHOOK_URL,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL
+    ):
+        self.url = url
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self.enviados = 0
+        self.reintentos = 0
+        self.fallidos = 0
+        self._despertar: Optional[asyncio.Event] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self._client = None
+
+    def notificar(self) -> None:
+        """Avisa que hay eventos nuevos (se entregan sin esperar el sondeo)"""
+        if self._despertar is not None:
+            self._despertar.set()
+
+    async def _reclamar(self) -> List[Reclamado]:
+        """Toma un lote de eventos vencidos y los reserva por OUTBOX_LEASE"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(OutboxEvento)
+                .where(OutboxEvento.estado == "pendiente", OutboxEvento.proximo_intento <= ahora())
+                .order_by(OutboxEvento.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            eventos = [
+                (e.id, e.tipo, e.payload, e.clave_idempotencia, e.intentos)
+                for e in result.scalars().all()
+            ]
+            if eventos:
+                await db.execute(
+                    update(OutboxEvento)
+                    .where(OutboxEvento.id.in_([e[0] for e in eventos]))
+                    .values(proximo_intento=ahora() + timedelta(seconds=OUTBOX_LEASE))
+                )
+            await db.commit()
+            return eventos
+
+    async def _entregar(self, evento: Reclamado) -> Optional[str]:
+        """Envía un evento; retorna None si se entregó o la descripción del error"""
+        import httpx
+        _, tipo, payload, clave, intentos = evento
+        try:
+            response = await self._client.post(
+                self.url,
+                json=payload,
+                headers={
+                    "Idempotency-Key": clave,
+                    "X-Evento": tipo,
+                    "X-Intento": str(intentos + 1),
+                }
+            )
+        except httpx.HTTPError as e:
+            return f"{type(e).__name__}: {e}"
+        if response.is_success:
+            return None
+        return f"HTTP {response.status_code}: {response.text[:200]}"
+
+    async def procesar_lote(self) -> int:
+        """Entrega un lote de eventos vencidos. Retorna cuántos se procesaron."""
+        eventos = await self._reclamar()
+        if not eventos:
+            return 0
+
+        errores = await asyncio.gather(*(self._entregar(evento) for evento in eventos))
+
+        async with AsyncSessionLocal() as db:
+            for (evento_id, tipo, _, _, intentos), error in zip(eventos, errores):
+                intentos += 1
+                if error is None:
+                    valores = {"estado": "enviado", "fecha_envio": ahora(), "ultimo_error": None}
+                    self.enviados += 1
+                    metrics.outbox_deliveries.inc("enviado")
+                elif intentos >= OUTBOX_MAX_ATTEMPTS:
+                    valores = {"estado": "fallido", "ultimo_error": error}
+                    self.fallidos += 1
+                    metrics.outbox_deliveries.inc("fallido")
+                    print(f"❌ Evento {tipo} {evento_id} descartado tras {intentos} intentos: {error}")
+                else:
+                    espera = backoff(intentos)
+                    valores = {
+                        "ultimo_error": error,
+                        "proximo_intento": ahora() + timedelta(seconds=espera),
+                    }
+                    self.reintentos += 1
+                    metrics.outbox_deliveries.inc("reintento")
+                    print(f"⚠️ Evento {tipo} {evento_id} falló ({error}); reintento en {espera:.0f} s")
+                await db.execute(
+                    update(OutboxEvento)
+                    .where(OutboxEvento.id == evento_id)
+                    .values(intentos=intentos, **valores)
+                )
+            await db.commit()
+        return len(eventos)
+
+    async def _ciclo(self) -> None:
+        while True:
+            self._despertar.clear()
+            try:
+                procesados = await self.procesar_lote()
+            except Exception as e:
+                print(f"❌ Error entregando eventos del outbox: {e}")
+                procesados = 0
+            if procesados >= self.batch_size:
+                continue  # quedan más eventos vencidos
+            try:
+                await asyncio.wait_for(self._despertar.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if not self.url:
+            print("⚠️ N8N_WEBHOOK_URL no configurado: las notificaciones de pedidos quedan pendientes")
+            return
+        import httpx
+        self._client = httpx.AsyncClient(timeout=OUTBOX_TIMEOUT)
+        self._despertar = asyncio.Event()
+        self._tarea = asyncio.create_task(self._ciclo())
+        print(f"✅ Outbox de pedidos activo (lotes de {self.batch_size})")
+
+    async def shutdown(self) -> None:
+        """
+        Detiene el worker. Un evento interrumpido a medio entregar se
+        reintenta al vencer su plazo (el receptor lo reconoce por su
+        Idempotency-Key).
+        """
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._despertar = None
+
+    def stats(self) -> dict:
+        return {
+            "activo": self._tarea is not None,
+            "enviados": self.enviados,
+            "reintentos": self.reintentos,
+            "fallidos": self.fallidos,
+        }
+
+
+outbox_worker = OutboxWorker()
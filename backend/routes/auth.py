@@ -25,7 +25,7 @@ async def login(credentials: LoginRequest):
     """
     Inicia sesión y retorna un token JWT
     """
-    user = authenticate_user(credentials.email, credentials.password)
+    user = await authenticate_user(credentials.email, credentials.password)
     if not user:
         raise HTTPException(
             status_code=401,
@@ -0,0 +1,317 @@
+"""
+Rutas de operaciones masivas sobre productos (importar, exportar, actualizar)
+"""
+import os
+import csv
+import io
+import json
+import codecs
+from typing import AsyncIterator, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert, select, update, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, read_sessionmaker, REPLICA_STICKY_COOKIE
+from models import Producto
+from schemas import (
+    ProductoCreate, BulkImportResponse, ProductoBulkUpdate, ProductoBulkUpdateResponse
+)
+from auth import require_admin
+from cache import catalog_cache
+from changes import change_log
+
+router = APIRouter(prefix="/productos", tags=["Productos"])
+
+# Configuración
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
+BULK_MAX_ERRORES = 1000
+# Ids por sentencia UPDATE (limita la cantidad de parámetros)
+BULK_UPDATE_CHUNK = 500
+
+EXPORT_COLUMNS = [
+    "id", "nombre", "descripcion", "precio", "categoria", "disponible",
+    "creado_por", "fecha_creacion", "fecha_actualizacion"
+]
+
+
+async def _lineas(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Decodifica el cuerpo por bloques y produce líneas completas (UTF-8)
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pendiente = ""
+    async for chunk in chunks:
+        pendiente += decoder.decode(chunk)
+        *lineas, pendiente = pendiente.split("\n")
+        for linea in lineas:
+            yield linea
+    pendiente += decoder.decode(b"", final=True)
+    if pendiente:
+        yield pendiente
+
+
+async def _filas_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple]:
+    """Produce (número de fila, dict o error) por cada línea JSON"""
+    numero = 0
+    async for linea in _lineas(chunks):
+        numero += 1
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+            if not isinstance(fila, dict):
+                raise ValueError("se esperaba un objeto JSON")
+            yield numero, fila
+        except ValueError as e:
+            yield numero, e
+
+
+async def _filas_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple]:
+    """
+    Produce (número de fila, dict o error) por cada registro CSV. La
+    primera fila son los nombres de columna; un campo entre comillas
+    puede ocupar varias líneas.
+    """
+    columnas = None
+    registro = ""
+    numero = 0
+    async for linea in _lineas(chunks):
+        registro = f"{registro}\n{linea}" if registro else linea
+        # Comillas impares: el registro continúa en la siguiente línea
+        if registro.count('"') % 2:
+            continue
+        texto, registro = registro.rstrip("\r"), ""
+        if not texto.strip():
+            continue
+        valores = next(csv.reader([texto]))
+        if columnas is None:
+            columnas = [c.strip() for c in valores]
+            continue
+        numero += 1
+        if len(valores) != len(columnas):
+            yield numero, ValueError(f"se esperaban {len(columnas)} columnas y hay {len(valores)}")
+            continue
+        # Celdas vacías = valor no enviado
+        yield numero, {c: v for c, v in zip(columnas, valores) if v != ""}
+
+
+def _detalle_error(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors()
+        )
+    return str(error)
+
+
+@router.post("/bulk", response_model=BulkImportResponse)
+async def importar_productos(
+    request: Request,
+    formato: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Importa productos desde un cuerpo CSV o NDJSON (solo administradores)
+
+    El cuerpo se lee por bloques, cada fila se valida con `ProductoCreate`
+    y las filas válidas se insertan en lotes de BULK_BATCH_SIZE, cada lote
+    en su propia transacción. Las filas inválidas se reportan sin detener
+    la importación.
+    """
+    if formato is None:
+        content_type = request.headers.get("content-type", "")
+        formato = "ndjson" if "json" in content_type else "csv"
+    filas = _filas_ndjson(request.stream()) if formato == "ndjson" else _filas_csv(request.stream())
+
+    lote: List[dict] = []
+    insertados = 0
+    total_filas = 0
+    errores = []
+    errores_omitidos = 0
+
+    async def insertar_lote():
+        nonlocal insertados
+        result = await db.execute(insert(Producto).returning(Producto.id), lote)
+        ids = list(result.scalars().all())
+        await db.commit()
+        insertados += len(lote)
+        lote.clear()
+        change_log.publicar("productos.creados", ids=ids)
+
+    try:
+        async for numero, fila in filas:
+            total_filas += 1
+            try:
+                if isinstance(fila, Exception):
+                    raise fila
+                producto = ProductoCreate(**fila)
+            except (ValidationError, ValueError, TypeError) as e:
+                if len(errores) < BULK_MAX_ERRORES:
+                    errores.append({"fila": numero, "detalle": _detalle_error(e)})
+                else:
+                    errores_omitidos += 1
+                continue
+
+            datos = producto.model_dump()
+            datos["creado_por"] = current_user.get("email")
+            if datos.get("disponible") is None:
+                datos["disponible"] = 1
+            lote.append(datos)
+
+            if len(lote) >= BULK_BATCH_SIZE:
+                await insertar_lote()
+
+        if lote:
+            await insertar_lote()
+
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error importando productos (se insertaron {insertados}): {str(e)}"
+        )
+
+    finally:
+        if insertados:
+            catalog_cache.invalidate()
+
+    return BulkImportResponse(
+        insertados=insertados,
+        total_filas=total_filas,
+        errores=errores,
+        errores_omitidos=errores_omitidos
+    )
+
+
+def _csv_linea(valores: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(valores)
+    return buffer.getvalue()
+
+
+def _valor(valor):
+    return valor.isoformat() if hasattr(valor, "isoformat") else valor
+
+
+@router.get("/export")
+async def exportar_productos(
+    request: Request,
+    formato: str = Query("csv", pattern="^(csv|ndjson)$"),
+    categoria: Optional[str] = None,
+    disponible: Optional[int] = None,
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Exporta los productos como CSV o NDJSON (solo administradores)
+
+    Las filas se leen con un cursor del lado del servidor y se envían a
+    medida que llegan, sin cargar la tabla completa en memoria.
+    """
+    columnas = [getattr(Producto, c) for c in EXPORT_COLUMNS]
+    query = select(*columnas).order_by(Producto.id)
+    if categoria:
+        query = query.where(Producto.categoria == categoria)
+    if disponible is not None:
+        query = query.where(Producto.disponible == disponible)
+
+    async def generar() -> AsyncIterator[bytes]:
+        # Sesión propia (réplica si hay): vive mientras se envía la respuesta
+        fabrica, _ = read_sessionmaker(REPLICA_STICKY_COOKIE in request.cookies)
+        async with fabrica() as db:
+            result = await db.stream(query.execution_options(yield_per=BULK_BATCH_SIZE))
+            if formato == "csv":
+                yield _csv_linea(EXPORT_COLUMNS).encode()
+            async for particion in result.partitions():
+                lineas = []
+                for fila in particion:
+                    valores = [_valor(v) for v in fila]
+                    if formato == "csv":
+                        lineas.append(_csv_linea(valores))
+                    else:
+                        lineas.append(json.dumps(dict(zip(EXPORT_COLUMNS, valores)), ensure_ascii=False) + "\n")
+                yield "".join(lineas).encode()
+
+    media_type = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        generar(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="productos.{formato}"'}
+    )
+
+
+def _update_por_ids(cambios: Dict[int, dict]):
+    """
+    Un solo UPDATE para varios productos con valores distintos:
+    cada columna toma su valor con CASE id WHEN ... THEN ... END
+    """
+    columnas = {columna for campos in cambios.values() for columna in campos}
+    valores = {}
+    for columna in columnas:
+        por_id = {pid: campos[columna] for pid, campos in cambios.items() if columna in campos}
+        valores[columna] = case(por_id, value=Producto.id, else_=getattr(Producto, columna))
+    return update(Producto).where(Producto.id.in_(list(cambios))).values(**valores)
+
+
+@router.patch("/bulk", response_model=ProductoBulkUpdateResponse)
+async def actualizar_productos(
+    datos: ProductoBulkUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Actualiza varios productos en una sola transacción (solo administradores)
+
+    - `items`: `[{"id": 1, "fields": {"precio": 9000}}, {"id": 2, "fields": {"disponible": 0}}]`
+      (también se aceptan los campos junto al id: `{"id": 1, "precio": 9000}`)
+    - `filtro` + `campos`: `{"filtro": {"categoria": "tortas"}, "campos": {"disponible": 0}}`
+
+    Retorna solo los ids afectados y su nueva versión.
+    """
+    sentencias = []
+
+    if datos.items is not None:
+        cambios: Dict[int, dict] = {}
+        for item in datos.items:
+            cambios.setdefault(item.id, {}).update(item.fields.model_dump(exclude_none=True))
+        ids = list(cambios)
+        for i in range(0, len(ids), BULK_UPDATE_CHUNK):
+            sentencias.append(_update_por_ids({pid: cambios[pid] for pid in ids[i:i + BULK_UPDATE_CHUNK]}))
+
+    else:
+        campos = datos.campos.model_dump(exclude_none=True)
+        filtro = datos.filtro
+        condiciones = []
+        if filtro.ids is not None:
+            condiciones.append(Producto.id.in_(filtro.ids))
+        if filtro.categoria:
+            condiciones.append(Producto.categoria == filtro.categoria)
+        if filtro.disponible is not None:
+            condiciones.append(Producto.disponible == filtro.disponible)
+        if not condiciones:
+            raise HTTPException(status_code=400, detail="El filtro debe incluir ids, categoria o disponible")
+        sentencias.append(update(Producto).where(*condiciones).values(**campos))
+
+    actualizados = []
+    try:
+        for sentencia in sentencias:
+            sentencia = (
+                sentencia
+                .values(version=Producto.version + 1)
+                .returning(Producto.id, Producto.version)
+                .execution_options(synchronize_session=False)
+            )
+            result = await db.execute(sentencia)
+            actualizados.extend({"id": fila.id, "version": fila.version} for fila in result)
+        await db.commit()
+
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error actualizando productos: {str(e)}")
+
+    actualizados.sort(key=lambda fila: fila["id"])
+    if actualizados:
+        catalog_cache.invalidate()
+        change_log.publicar("productos.actualizados", productos=actualizados)
+
+    return ProductoBulkUpdateResponse(actualizados=actualizados)
@@ -0,0 +1,92 @@
+"""
+Rutas para pedidos
+"""
+from fastapi import APIRouter, Depends, Header, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select
+from typing import Optional
+from database import get_db
+from models import Pedido
+from schemas import PedidoCreate, PedidoResponse
+from outbox import outbox_worker, nuevo_evento, ahora
+
+router = APIRouter(prefix="/pedidos", tags=["Pedidos"])
+
+
+def _respuesta(pedido: Pedido) -> PedidoResponse:
+    """Pedido en el formato que usa el frontend (y que recibe n8n)"""
+    return PedidoResponse(
+        id=pedido.id,
+        cliente={
+            "nombre": pedido.cliente_nombre,
+            "telefono": pedido.cliente_telefono,
+            "direccion": pedido.cliente_direccion,
+            "email": pedido.cliente_email,
+        },
+        productos=pedido.productos,
+        total=pedido.total,
+        observaciones=pedido.observaciones,
+        estado=pedido.estado,
+        fecha=pedido.fecha_creacion
+    )
+
+
+async def _pedido_por_clave(db: AsyncSession, clave: str) -> Optional[Pedido]:
+    result = await db.execute(select(Pedido).where(Pedido.clave_idempotencia == clave))
+    return result.scalar_one_or_none()
+
+
+@router.post("/", response_model=PedidoResponse, status_code=201)
+async def crear_pedido(
+    pedido: PedidoCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Registra un pedido (público)
+    
+    El pedido y su notificación para n8n se guardan en la misma
+    transacción; la notificación se entrega en segundo plano. Si el
+    cliente reintenta con el mismo header `Idempotency-Key` se retorna
+    el pedido ya creado.
+    """
+    if idempotency_key:
+        existente = await _pedido_por_clave(db, idempotency_key)
+        if existente is not None:
+            return _respuesta(existente)
+    
+    nuevo_pedido = Pedido(
+        cliente_nombre=pedido.cliente.nombre,
+        cliente_telefono=pedido.cliente.telefono,
+        cliente_direccion=pedido.cliente.direccion,
+        cliente_email=pedido.cliente.email or None,
+        productos=[producto.model_dump() for producto in pedido.productos],
+        total=pedido.total,
+        observaciones=(pedido.observaciones or "").strip(),
+        estado="pendiente",
+        clave_idempotencia=idempotency_key,
+        fecha_creacion=ahora()
+    )
+    
+    try:
+        db.add(nuevo_pedido)
+        await db.flush()  # asigna el id
+        respuesta = _respuesta(nuevo_pedido)
+        db.add(nuevo_evento("pedido.creado", respuesta.model_dump(mode="json")))
+        await db.commit()
+    
+    except IntegrityError:
+        # Otra petición con la misma Idempotency-Key se guardó primero
+        await db.rollback()
+        existente = await _pedido_por_clave(db, idempotency_key) if idempotency_key else None
+        if existente is None:
+            raise HTTPException(status_code=500, detail="Error registrando pedido")
+        return _respuesta(existente)
+    
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error registrando pedido: {str(e)}")
+    
+    outbox_worker.notificar()
+    return respuesta
@@ -1,24 +1,148 @@
 """
 Rutas para gestión de productos
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request, Query, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import List, Optional
-from database import get_db
+from sqlalchemy import select, func, update, case, literal, true, tuple_, DateTime
+from sqlalchemy.dialects import sqlite
+from typing import AsyncIterator, Dict, List, Literal, Optional
+from datetime import datetime
+import os
+import base64
+import json
+import asyncio
+from database import get_db, get_read_db, retraso_replica, AsyncSessionLocal
 from models import Producto, ImagenProducto
 from schemas import (
     ProductoCreate, 
     ProductoUpdate, 
     ProductoResponse, 
     ProductoListResponse,
+    ProductoFacetsResponse,
+    CategoriaFacet,
+    PrecioFacet,
+    PrecioRango,
     MessageResponse
 )
 from auth import require_admin
-from utils import save_image, delete_product_images, delete_image
+from cache import catalog_cache, CachedResponse, conditional_response
+from utils import (
+    ingest_upload,
+    store_image,
+    upload_chunks,
+    validate_image,
+    finalize_pending_image,
+    image_path_from_url,
+    touch_image,
+    PENDING_SUFFIX,
+    MAX_IMAGE_SIZE_MB
+)
+from image_pipeline import image_pipeline, IMAGE_PROCESSING_WAIT
+from search import buscar_ids
+from fragments import COLUMNAS_VERSION, obtener_fragmentos, renderizar, descartar, lista_json
+from changes import change_log
+from media_gc import media_reclaimer
 
 router = APIRouter(prefix="/productos", tags=["Productos"])
 
+# Rangos del histograma de precios de /productos/facets
+FACETS_PRICE_BUCKETS = max(1, int(os.getenv("FACETS_PRICE_BUCKETS", "10")))
+
+
+Orden = Literal["id", "precio_asc", "precio_desc", "recientes", "nombre"]
+
+# sort => (columna, descendente). El id desempata y hace el orden estable.
+ORDENES = {
+    "id": (Producto.id, False),
+    "precio_asc": (Producto.precio, False),
+    "precio_desc": (Producto.precio, True),
+    "recientes": (Producto.fecha_creacion, True),
+    "nombre": (Producto.nombre, False),
+}
+
+# SQLite guarda fecha_creacion sin microsegundos (CURRENT_TIMESTAMP) y
+# compara fechas como texto: el valor del cursor debe tener el mismo formato
+_FECHA_CURSOR = DateTime(timezone=True).with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite")
+
+
+def _encode_cursor(producto_id: int, sort: str = "id", clave=None) -> str:
+    """Cursor opaco con la clave de orden del último producto de la página"""
+    payload = {"id": producto_id}
+    if sort != "id":
+        payload["s"] = sort
+        payload["k"] = clave.isoformat() if isinstance(clave, datetime) else clave
+    data = json.dumps(payload, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str = "id") -> tuple:
+    """
+    Obtiene (id, clave de orden) desde un cursor generado por
+    `_encode_cursor`. El cursor solo sirve para el mismo `sort`.
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(cursor + padding))
+        producto_id = int(payload["id"])
+        if payload.get("s", "id") != sort:
+            raise ValueError("orden distinto")
+        clave = payload.get("k")
+        if sort == "recientes":
+            clave = datetime.fromisoformat(clave)
+        elif sort in ("precio_asc", "precio_desc"):
+            clave = float(clave)
+        elif sort == "nombre" and not isinstance(clave, str):
+            raise ValueError("clave inválida")
+        return producto_id, clave
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def _filtros(
+    categoria: Optional[str] = None,
+    disponible: Optional[int] = None,
+    precio_min: Optional[float] = None,
+    precio_max: Optional[float] = None
+) -> list:
+    """Condiciones de los filtros del listado"""
+    filtros = []
+    if categoria:
+        filtros.append(Producto.categoria == categoria)
+    if disponible is not None:
+        filtros.append(Producto.disponible == disponible)
+    if precio_min is not None:
+        filtros.append(Producto.precio >= precio_min)
+    if precio_max is not None:
+        filtros.append(Producto.precio <= precio_max)
+    return filtros
+
+
+def consulta_listado(filtros: list, sort: str = "id", despues: Optional[tuple] = None):
+    """
+    Consulta de una página del listado: id, versión y clave de orden.
+    `despues` es el (id, clave) del último producto de la página anterior
+    (paginación por cursor sobre la clave de orden y el id).
+    """
+    columna, descendente = ORDENES[sort]
+    query = select(*COLUMNAS_VERSION, columna.label("clave")).where(*filtros)
+    
+    if despues is not None:
+        producto_id, clave = despues
+        if sort == "id":
+            query = query.where(Producto.id > producto_id)
+        else:
+            tipo = _FECHA_CURSOR if sort == "recientes" else columna.type
+            actual = tuple_(columna, Producto.id)
+            anterior = tuple_(literal(clave, type_=tipo), literal(producto_id))
+            query = query.where(actual < anterior if descendente else actual > anterior)
+    
+    if sort == "id":
+        return query.order_by(Producto.id)
+    if descendente:
+        return query.order_by(columna.desc(), Producto.id.desc())
+    return query.order_by(columna, Producto.id)
+
 
 @router.post("/", response_model=ProductoResponse, status_code=201)
 async def crear_producto(
@@ -46,6 +170,8 @@ async def crear_producto(
         
         db.add(nuevo_producto)
         await db.commit()
+        catalog_cache.invalidate()
+        change_log.publicar("producto.creado", id=nuevo_producto.id)
         await db.refresh(nuevo_producto, ["imagenes"])  # Refresh con relaciones
         
         return nuevo_producto
@@ -58,16 +184,109 @@ async def crear_producto(
         raise HTTPException(status_code=500, detail=f"Error creando producto: {str(e)}")
 
 
-@router.post("/{producto_id}/imagenes", response_model=MessageResponse)
-async def subir_imagenes(
+# Imágenes pendientes que este proceso está optimizando (url => aviso al terminar)
+_imagenes_en_proceso: Dict[str, asyncio.Event] = {}
+
+
+async def _finalizar_pendiente(url_imagen: str) -> tuple:
+    """
+    Optimiza una imagen pendiente y retorna (estado, url, variantes).
+    Si otra tarea ya la terminó (misma subida reutilizada o reanudada
+    al arrancar) retorna su URL definitiva con variantes None.
+    """
+    en_curso = _imagenes_en_proceso.get(url_imagen)
+    if en_curso is not None:
+        await en_curso.wait()
+    final_url = url_imagen.replace(PENDING_SUFFIX, "", 1)
+    
+    aviso = _imagenes_en_proceso[url_imagen] = asyncio.Event()
+    try:
+        if image_path_from_url(url_imagen).exists():
+            procesada = await finalize_pending_image(url_imagen)
+            return ("lista", procesada["url"], procesada["variantes"])
+    except Exception as e:
+        if image_path_from_url(url_imagen).exists() or not image_path_from_url(final_url).exists():
+            print(f"❌ Error procesando imagen {url_imagen}: {e}")
+            return ("error", url_imagen, None)
+    finally:
+        aviso.set()
+        if _imagenes_en_proceso.get(url_imagen) is aviso:
+            del _imagenes_en_proceso[url_imagen]
+    
+    if not image_path_from_url(final_url).exists():
+        print(f"❌ Imagen pendiente sin archivo: {url_imagen}")
+        return ("error", url_imagen, None)
+    return ("lista", final_url, None)
+
+
+async def _procesar_imagenes_pendientes(urls: List[str]):
+    """
+    Optimiza en segundo plano imágenes subidas con estado "pendiente"
+    y actualiza el estado de todos los registros que las usan
+    """
+    resultados = {}
+    for url_imagen in urls:
+        resultados[url_imagen] = await _finalizar_pendiente(url_imagen)
+    
+    async with AsyncSessionLocal() as db:
+        # Las que ya había terminado otra tarea toman las variantes de sus registros
+        for url_imagen, (estado, final_url, variantes) in resultados.items():
+            if estado == "lista" and variantes is None:
+                result = await db.execute(
+                    select(ImagenProducto.variantes)
+                    .where(ImagenProducto.url_imagen == final_url, ImagenProducto.estado == "lista")
+                    .limit(1)
+                )
+                resultados[url_imagen] = (estado, final_url, result.scalar())
+        
+        result = await db.execute(
+            select(ImagenProducto).where(ImagenProducto.url_imagen.in_(resultados))
+        )
+        productos = set()
+        for imagen in result.scalars().all():
+            imagen.estado, imagen.url_imagen, imagen.variantes = resultados[imagen.url_imagen]
+            productos.add(imagen.producto_id)
+        if productos:
+            await db.execute(
+                update(Producto)
+                .where(Producto.id.in_(productos))
+                .values(version=Producto.version + 1)
+            )
+        await db.commit()
+    catalog_cache.invalidate()
+    if productos:
+        change_log.publicar("imagenes.actualizadas", producto_ids=sorted(productos))
+
+
+async def reanudar_imagenes_pendientes() -> int:
+    """
+    Vuelve a encolar las imágenes que quedaron "pendiente" (tarea
+    cancelada al apagar, caída o redeploy). Se llama al arrancar.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(ImagenProducto.url_imagen)
+            .where(ImagenProducto.estado == "pendiente")
+            .distinct()
+        )
+        urls = list(result.scalars().all())
+    if urls:
+        image_pipeline.spawn(_procesar_imagenes_pendientes(urls))
+    return len(urls)
+
+
+async def _guardar_imagenes(
+    db: AsyncSession,
     producto_id: int,
-    imagenes: List[UploadFile] = File(...),
-    db: AsyncSession = Depends(get_db),
-    current_user: dict = Depends(require_admin)
-):
+    fuentes: List[AsyncIterator[bytes]],
+    esperar: Optional[bool]
+) -> MessageResponse:
     """
-    Sube una o varias imágenes para un producto (solo administradores)
+    Guarda imágenes leídas por bloques y crea sus registros
     """
+    if esperar is None:
+        esperar = IMAGE_PROCESSING_WAIT
+    
     # Verificar que el producto existe
     result = await db.execute(select(Producto).where(Producto.id == producto_id))
     producto = result.scalar_one_or_none()
@@ -75,7 +294,16 @@ async def subir_imagenes(
     if not producto:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
+    if not esperar and image_pipeline.is_full():
+        raise HTTPException(
+            status_code=503,
+            detail="Hay demasiadas imágenes en proceso, intenta de nuevo en unos segundos",
+            headers={"Retry-After": "5"}
+        )
+    
     imagenes_guardadas = []
+    archivos_nuevos = []
+    pendientes = []
     
     try:
         # Obtener el orden máximo actual
@@ -86,89 +314,389 @@ async def subir_imagenes(
         max_orden = result.scalar() or 0
         
         # Guardar cada imagen
-        for idx, imagen in enumerate(imagenes):
-            # Guardar archivo
-            url_imagen = await save_image(imagen, producto_id)
+        for idx, fuente in enumerate(fuentes):
+            data, ext, content_hash = await ingest_upload(fuente)
+            
+            # Mismo contenido ya guardado: se reutiliza sin re-codificar
+            # (salvo que no se haya podido procesar)
+            result = await db.execute(
+                select(ImagenProducto)
+                .where(ImagenProducto.hash_contenido == content_hash, ImagenProducto.estado != "error")
+                .limit(1)
+            )
+            existente = result.scalar_one_or_none()
+            
+            if existente is not None:
+                url_imagen = existente.url_imagen
+                variantes = existente.variantes
+                estado = existente.estado
+                touch_image(url_imagen)
+                if estado == "pendiente" and url_imagen not in pendientes:
+                    # Puede ser de una tarea que ya no existe: se vuelve a encolar
+                    pendientes.append(url_imagen)
+            else:
+                # Guardar archivo
+                guardada = await store_image(data, ext, content_hash, optimize=esperar)
+                url_imagen = guardada["url"]
+                variantes = guardada["variantes"] or None
+                estado = "lista" if esperar else "pendiente"
+                archivos_nuevos.append(url_imagen)
+                if not esperar:
+                    pendientes.append(url_imagen)
+            
+            imagenes_guardadas.append(url_imagen)
             
             # Crear registro en BD
             nueva_imagen = ImagenProducto(
                 producto_id=producto_id,
                 url_imagen=url_imagen,
-                orden=max_orden + idx + 1
+                hash_contenido=content_hash,
+                orden=max_orden + idx + 1,
+                estado=estado,
+                variantes=variantes
             )
             db.add(nueva_imagen)
-            imagenes_guardadas.append(url_imagen)
         
+        producto.version = Producto.version + 1
         await db.commit()
-        
-        return MessageResponse(
-            message=f"{len(imagenes_guardadas)} imagen(es) subida(s) correctamente",
-            detail={"urls": imagenes_guardadas}
-        )
+        catalog_cache.invalidate()
+        change_log.publicar("imagenes.actualizadas", producto_ids=[producto_id])
     
     except Exception as e:
         await db.rollback()
-        # Limpiar imágenes guardadas en caso de error
-        for url in imagenes_guardadas:
-            delete_image(url)
+        # Limpiar archivos creados por esta petición en caso de error (si
+        # otra subida del mismo contenido ya los usa, el reclaimer los conserva)
+        media_reclaimer.liberar(archivos_nuevos)
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=f"Error subiendo imágenes: {str(e)}")
+    
+    if pendientes:
+        image_pipeline.spawn(_procesar_imagenes_pendientes(pendientes))
+    
+    return MessageResponse(
+        message=f"{len(imagenes_guardadas)} imagen(es) subida(s) correctamente",
+        detail={
+            "urls": imagenes_guardadas,
+            "estado": "lista" if esperar else "pendiente"
+        }
+    )
+
+
+@router.post("/{producto_id}/imagenes", response_model=MessageResponse)
+async def subir_imagenes(
+    producto_id: int,
+    imagenes: List[UploadFile] = File(...),
+    esperar: Optional[bool] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Sube una o varias imágenes para un producto (solo administradores)
+    
+    Con `esperar=false` responde en cuanto los originales están guardados
+    y las imágenes quedan en estado "pendiente" hasta que se optimizan.
+    """
+    for imagen in imagenes:
+        validate_image(imagen)
+    
+    return await _guardar_imagenes(
+        db, producto_id, [upload_chunks(imagen) for imagen in imagenes], esperar
+    )
+
+
+@router.post("/{producto_id}/imagenes/stream", response_model=MessageResponse)
+async def subir_imagen_stream(
+    producto_id: int,
+    request: Request,
+    esperar: Optional[bool] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Sube una imagen enviada como cuerpo crudo de la petición (solo administradores)
+    
+    El cuerpo se lee directamente de la conexión, sin pasar por el parser
+    multipart: un archivo demasiado grande o que no es imagen se rechaza
+    con los primeros bloques.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_IMAGE_SIZE_MB * 1024 * 1024:
+        raise HTTPException(
+            status_code=400,
+            detail=f"La imagen excede el tamaño máximo de {MAX_IMAGE_SIZE_MB}MB"
+        )
+    
+    return await _guardar_imagenes(db, producto_id, [request.stream()], esperar)
 
 
 @router.get("/", response_model=ProductoListResponse)
 async def listar_productos(
+    request: Request,
     categoria: Optional[str] = None,
     disponible: Optional[int] = None,
+    precio_min: Optional[float] = Query(None, ge=0),
+    precio_max: Optional[float] = Query(None, ge=0),
+    sort: Orden = "id",
     skip: int = 0,
     limit: int = 100,
-    db: AsyncSession = Depends(get_db)
+    cursor: Optional[str] = None,
+    incluir_total: bool = True,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Lista todos los productos con sus imágenes (público)
+    
+    Filtros por categoría, disponibilidad y rango de precio. `sort`:
+    `id` (por defecto), `precio_asc`, `precio_desc`, `recientes` o `nombre`.
+    
+    Paginación por offset (`skip`/`limit`) o por cursor: si se envía
+    `cursor` (el `next_cursor` de la página anterior) se ignora `skip` y
+    cada página cuesta lo mismo sin importar su profundidad.
+    Con `incluir_total=false` no se calcula el total.
     """
+    # Respuesta ya serializada desde el cache (304 si el cliente la tiene)
+    cache_key = (
+        "listar", categoria, disponible, precio_min, precio_max, sort,
+        skip, limit, cursor, incluir_total
+    )
+    entry = catalog_cache.get(cache_key)
+    if entry is not None:
+        return conditional_response(request, entry)
+    
+    version = catalog_cache.version
+    despues = _decode_cursor(cursor, sort) if cursor else None
+    filtros = _filtros(categoria, disponible, precio_min, precio_max)
+    
     try:
-        # Construir query
-        query = select(Producto)
-        
-        # Aplicar filtros
-        if categoria:
-            query = query.where(Producto.categoria == categoria)
-        if disponible is not None:
-            query = query.where(Producto.disponible == disponible)
-        
-        # Contar total
-        count_query = select(func.count()).select_from(query.subquery())
-        result = await db.execute(count_query)
-        total = result.scalar()
+        # Contar total (compartido por todas las páginas del mismo filtro)
+        total = None
+        if incluir_total:
+            total_key = ("total", categoria, disponible, precio_min, precio_max)
+            total = catalog_cache.get(total_key)
+            if total is None:
+                count_query = select(func.count()).select_from(Producto).where(*filtros)
+                result = await db.execute(count_query)
+                total = result.scalar()
+                catalog_cache.set(total_key, total, version=version, retraso=retraso_replica(db))
         
-        # Obtener productos con paginación
-        query = query.offset(skip).limit(limit)
+        # Solo id, versión y clave de orden: el resto sale de los fragmentos
+        query = consulta_listado(filtros, sort, despues)
+        if despues is None:
+            query = query.offset(skip)
+        query = query.limit(limit)
         result = await db.execute(query)
-        productos = result.scalars().all()
+        filas = result.all()
         
-        return ProductoListResponse(
-            total=total,
-            productos=productos
-        )
+        next_cursor = None
+        if filas and len(filas) == limit:
+            next_cursor = _encode_cursor(filas[-1].id, sort, filas[-1].clave)
+        
+        fragmentos = await obtener_fragmentos(db, [fila[:3] for fila in filas])
+        entry = CachedResponse(lista_json(total, fragmentos, next_cursor))
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listando productos: {str(e)}")
+    
+    catalog_cache.set(cache_key, entry, version=version, retraso=retraso_replica(db))
+    return conditional_response(request, entry)
+
+
+@router.get("/search", response_model=ProductoListResponse)
+async def buscar_productos(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    categoria: Optional[str] = None,
+    disponible: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Busca productos por nombre y descripción, ordenados por relevancia (público)
+    
+    Retorna los `limit` más relevantes; `total` es null (no se cuentan
+    todas las coincidencias).
+    """
+    cache_key = ("buscar", q.strip().lower(), categoria, disponible, limit)
+    entry = catalog_cache.get(cache_key)
+    if entry is not None:
+        return conditional_response(request, entry)
+    
+    version = catalog_cache.version
+    
+    try:
+        ids = await buscar_ids(db, q, categoria=categoria, disponible=disponible, limit=limit)
+        
+        fragmentos = []
+        if ids:
+            result = await db.execute(select(*COLUMNAS_VERSION).where(Producto.id.in_(ids)))
+            por_id = {fila.id: fila for fila in result.all()}
+            fragmentos = await obtener_fragmentos(db, [por_id[i] for i in ids if i in por_id])
+        
+        entry = CachedResponse(lista_json(None, fragmentos))
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error buscando productos: {str(e)}")
+    
+    catalog_cache.set(cache_key, entry, version=version, retraso=retraso_replica(db))
+    return conditional_response(request, entry)
+
+
+def _rango_precio(limites, rangos: int):
+    """
+    Índice del rango de precio (0..rangos-1) de cada producto. Se usa
+    CASE en lugar de floor() para que funcione igual en SQLite y PostgreSQL.
+    """
+    if rangos == 1:
+        return literal(0)
+    ancho = (limites.c.maximo - limites.c.minimo) / rangos
+    return case(
+        *[(Producto.precio < limites.c.minimo + ancho * (i + 1), i) for i in range(rangos - 1)],
+        else_=rangos - 1
+    )
+
+
+@router.get("/facets", response_model=ProductoFacetsResponse)
+async def facetas_productos(
+    request: Request,
+    categoria: Optional[str] = None,
+    disponible: Optional[int] = None,
+    precio_min: Optional[float] = Query(None, ge=0),
+    precio_max: Optional[float] = Query(None, ge=0),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Conteos por categoría y disponibilidad, y precio mínimo, máximo e
+    histograma de los productos que cumplen los filtros (público)
+    """
+    cache_key = ("facets", categoria, disponible, precio_min, precio_max)
+    entry = catalog_cache.get(cache_key)
+    if entry is not None:
+        return conditional_response(request, entry)
+    
+    version = catalog_cache.version
+    filtros = _filtros(categoria, disponible, precio_min, precio_max)
+    
+    try:
+        # Una sola consulta agrupada: los límites de precio salen de un CTE
+        limites = (
+            select(func.min(Producto.precio).label("minimo"), func.max(Producto.precio).label("maximo"))
+            .where(*filtros)
+            .cte("limites")
+        )
+        # El rango se calcula en una subconsulta y se agrupa por su columna
+        # (agrupar por la expresión CASE repite parámetros en PostgreSQL)
+        precios = (
+            select(
+                Producto.categoria,
+                Producto.disponible,
+                _rango_precio(limites, FACETS_PRICE_BUCKETS).label("rango"),
+                limites.c.minimo,
+                limites.c.maximo
+            )
+            .select_from(Producto)
+            .join(limites, true())
+            .where(*filtros)
+            .subquery()
+        )
+        query = (
+            select(*precios.c, func.count().label("productos"))
+            .group_by(*precios.c)
+        )
+        result = await db.execute(query)
+        filas = result.all()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calculando facetas: {str(e)}")
+    
+    total = disponibles = 0
+    minimo = maximo = None
+    por_categoria = {}
+    por_rango = [0] * FACETS_PRICE_BUCKETS
+    for fila in filas:
+        minimo, maximo = fila.minimo, fila.maximo
+        conteo = por_categoria.setdefault(fila.categoria, [0, 0])
+        conteo[0] += fila.productos
+        total += fila.productos
+        if fila.disponible == 1:
+            conteo[1] += fila.productos
+            disponibles += fila.productos
+        por_rango[fila.rango] += fila.productos
+    
+    histograma = []
+    if minimo is not None and minimo == maximo:
+        histograma = [PrecioRango(desde=minimo, hasta=maximo, productos=total)]
+    elif minimo is not None:
+        ancho = (maximo - minimo) / FACETS_PRICE_BUCKETS
+        histograma = [
+            PrecioRango(
+                desde=round(minimo + ancho * i, 2),
+                hasta=round(minimo + ancho * (i + 1), 2) if i < FACETS_PRICE_BUCKETS - 1 else maximo,
+                productos=productos
+            )
+            for i, productos in enumerate(por_rango)
+        ]
+    
+    entry = CachedResponse(ProductoFacetsResponse(
+        total=total,
+        disponibles=disponibles,
+        no_disponibles=total - disponibles,
+        categorias=[
+            CategoriaFacet(categoria=nombre, total=conteo[0], disponibles=conteo[1])
+            for nombre, conteo in sorted(por_categoria.items())
+        ],
+        precio=PrecioFacet(min=minimo, max=maximo, histograma=histograma)
+    ).model_dump_json().encode())
+    catalog_cache.set(cache_key, entry, version=version, retraso=retraso_replica(db))
+    return conditional_response(request, entry)
+
+
+@router.get("/changes")
+async def cambios_productos(last_event_id: Optional[str] = Header(None, max_length=100)):
+    """
+    Cambios del catálogo como Server-Sent Events (público)
+    
+    Cada evento (`producto.creado`, `producto.actualizado`,
+    `producto.eliminado`, `imagenes.actualizadas`, `productos.creados`,
+    `productos.actualizados`) lleva la versión del catálogo. Al
+    reconectar con `Last-Event-ID` se reciben los cambios perdidos, o un
+    evento `reset` si ya no están en el registro.
+    """
+    return StreamingResponse(
+        change_log.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # sin buffer en nginx
+        }
+    )
 
 
 @router.get("/{producto_id}", response_model=ProductoResponse)
 async def obtener_producto(
     producto_id: int,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Obtiene los detalles de un producto específico (público)
     """
-    result = await db.execute(select(Producto).where(Producto.id == producto_id))
-    producto = result.scalar_one_or_none()
+    cache_key = ("obtener", producto_id)
+    entry = catalog_cache.get(cache_key)
+    if entry is not None:
+        return conditional_response(request, entry)
     
-    if not producto:
+    version = catalog_cache.version
+    
+    result = await db.execute(select(*COLUMNAS_VERSION).where(Producto.id == producto_id))
+    fila = result.one_or_none()
+    fragmentos = await obtener_fragmentos(db, [fila]) if fila else []
+    
+    if not fragmentos:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
-    return producto
+    entry = CachedResponse(fragmentos[0])
+    catalog_cache.set(cache_key, entry, version=version, retraso=retraso_replica(db))
+    return conditional_response(request, entry)
 
 
 @router.put("/{producto_id}", response_model=ProductoResponse)
@@ -204,9 +732,13 @@ async def actualizar_producto(
             producto.categoria = categoria
         if disponible is not None:
             producto.disponible = disponible
+        producto.version = Producto.version + 1
         
         await db.commit()
+        catalog_cache.invalidate()
         await db.refresh(producto)
+        renderizar(producto)
+        change_log.publicar("producto.actualizado", id=producto_id, version_producto=producto.version)
         
         return producto
     
@@ -231,22 +763,27 @@ async def eliminar_producto(
     if not producto:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
+    urls = [imagen.url_imagen for imagen in producto.imagenes]
+    
     try:
-        # Eliminar imágenes del filesystem
-        delete_product_images(producto_id)
-        
         # Eliminar producto (las imágenes en BD se eliminan por CASCADE)
         await db.delete(producto)
         await db.commit()
-        
-        return MessageResponse(
-            message="Producto eliminado correctamente",
-            detail={"producto_id": producto_id}
-        )
+        catalog_cache.invalidate()
+        descartar(producto_id)
+        change_log.publicar("producto.eliminado", id=producto_id)
     
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error eliminando producto: {str(e)}")
+    
+    # Los archivos que ya no tienen referencias se eliminan en segundo plano
+    media_reclaimer.liberar(urls, producto_id=producto_id)
+    
+    return MessageResponse(
+        message="Producto eliminado correctamente",
+        detail={"producto_id": producto_id}
+    )
 
 
 @router.delete("/{producto_id}/imagenes/{imagen_id}", response_model=MessageResponse)
@@ -272,19 +809,25 @@ async def eliminar_imagen(
         raise HTTPException(status_code=404, detail="Imagen no encontrada")
     
     try:
-        # Eliminar archivo
-        delete_image(imagen.url_imagen)
-        
         # Eliminar registro
         await db.delete(imagen)
-        await db.commit()
-        
-        return MessageResponse(
-            message="Imagen eliminada correctamente",
-            detail={"imagen_id": imagen_id}
+        await db.execute(
+            update(Producto)
+            .where(Producto.id == producto_id)
+            .values(version=Producto.version + 1)
         )
+        await db.commit()
+        catalog_cache.invalidate()
+        change_log.publicar("imagenes.actualizadas", producto_ids=[producto_id])
     
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error eliminando imagen: {str(e)}")
-
+    
+    # El archivo se elimina en segundo plano si era la última referencia
+    media_reclaimer.liberar([imagen.url_imagen])
+    
+    return MessageResponse(
+        message="Imagen eliminada correctamente",
+        detail={"imagen_id": imagen_id}
+    )
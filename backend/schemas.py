@@ -1,8 +1,8 @@
 """
 Schemas de Pydantic para validación
 """
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, field_validator, computed_field, model_validator
+from typing import Dict, List, Optional, Union
 from datetime import datetime
 
 
@@ -17,13 +17,36 @@ class ImagenProductoCreate(ImagenProductoBase):
     pass
 
 
+class ImagenVariante(BaseModel):
+    """Schema para una variante redimensionada de una imagen"""
+    ancho: int
+    formato: str
+    url: str
+
+
 class ImagenProductoResponse(ImagenProductoBase):
     """Schema para respuesta de Imagen de Producto"""
     id: int
     producto_id: int
     fecha_subida: Optional[datetime] = None
+    estado: Optional[str] = "lista"
+    variantes: List[ImagenVariante] = []
     
     model_config = ConfigDict(from_attributes=True, arbitrary_types_allowed=True)
+    
+    @field_validator("variantes", mode="before")
+    @classmethod
+    def variantes_vacias(cls, value):
+        return value or []
+    
+    @computed_field
+    @property
+    def srcset(self) -> Dict[str, str]:
+        """Valor listo para `srcset` por formato: {"webp": "url 200w, url 480w"}"""
+        por_formato: Dict[str, List[str]] = {}
+        for variante in self.variantes:
+            por_formato.setdefault(variante.formato, []).append(f"{variante.url} {variante.ancho}w")
+        return {formato: ", ".join(urls) for formato, urls in por_formato.items()}
 
 
 class ProductoBase(BaseModel):
@@ -52,6 +75,7 @@ class ProductoUpdate(BaseModel):
 class ProductoResponse(ProductoBase):
     """Schema para respuesta de Producto"""
     id: int
+    version: int = 1
     creado_por: Optional[str] = None
     fecha_creacion: Optional[datetime] = None
     fecha_actualizacion: Optional[datetime] = None
@@ -62,8 +86,9 @@ class ProductoResponse(ProductoBase):
 
 class ProductoListResponse(BaseModel):
     """Schema para lista de productos"""
-    total: int
+    total: Optional[int] = None
     productos: List[ProductoResponse]
+    next_cursor: Optional[str] = None
 
 
 class MessageResponse(BaseModel):
@@ -71,3 +96,155 @@ class MessageResponse(BaseModel):
     message: str
     detail: Optional[dict] = None
 
+
+class BulkImportError(BaseModel):
+    """Fila rechazada en una importación masiva"""
+    fila: int
+    detalle: str
+
+
+class BulkImportResponse(BaseModel):
+    """Resultado de una importación masiva de productos"""
+    insertados: int
+    total_filas: int
+    errores: List[BulkImportError] = []
+    errores_omitidos: int = 0
+
+
+class ProductoBulkCampos(ProductoUpdate):
+    """Campos que cambia una actualización masiva (al menos uno)"""
+    model_config = ConfigDict(extra="forbid")
+
+    @model_validator(mode="after")
+    def validar_cambios(self):
+        if not self.model_dump(exclude_none=True):
+            raise ValueError("Indica al menos un campo a cambiar")
+        return self
+
+
+class ProductoBulkItem(BaseModel):
+    """
+    Cambios para un producto en una actualización masiva:
+    `{"id": 1, "fields": {"precio": 9000}}` o `{"id": 1, "precio": 9000}`
+    """
+    model_config = ConfigDict(extra="forbid")
+
+    id: int
+    fields: ProductoBulkCampos
+
+    @model_validator(mode="before")
+    @classmethod
+    def campos_planos(cls, data):
+        if isinstance(data, dict) and "fields" not in data:
+            return {"id": data.get("id"), "fields": {k: v for k, v in data.items() if k != "id"}}
+        return data
+
+
+class ProductoBulkFiltro(BaseModel):
+    """Productos afectados por una actualización masiva con filtro"""
+    model_config = ConfigDict(extra="forbid")
+
+    ids: Optional[List[int]] = None
+    categoria: Optional[str] = None
+    disponible: Optional[int] = None
+
+
+class ProductoBulkUpdate(BaseModel):
+    """
+    Actualización masiva: una lista de `items` con sus cambios, o un
+    `filtro` con los `campos` que se aplican a todos los que coincidan
+    """
+    model_config = ConfigDict(extra="forbid")
+
+    items: Optional[List[ProductoBulkItem]] = None
+    filtro: Optional[ProductoBulkFiltro] = None
+    campos: Optional[ProductoBulkCampos] = None
+
+    @model_validator(mode="after")
+    def validar_modo(self):
+        if (self.items is None) == (self.filtro is None):
+            raise ValueError("Envía `items` o `filtro` (no ambos)")
+        if self.filtro is not None and self.campos is None:
+            raise ValueError("`filtro` requiere `campos`")
+        return self
+
+
+class ProductoVersion(BaseModel):
+    """Id y versión de un producto actualizado"""
+    id: int
+    version: int
+
+
+class ProductoBulkUpdateResponse(BaseModel):
+    """Resultado de una actualización masiva"""
+    actualizados: List[ProductoVersion]
+
+
+class CategoriaFacet(BaseModel):
+    """Conteo de productos de una categoría"""
+    categoria: str
+    total: int
+    disponibles: int
+
+
+class PrecioRango(BaseModel):
+    """Un rango del histograma de precios"""
+    desde: float
+    hasta: float
+    productos: int
+
+
+class PrecioFacet(BaseModel):
+    """Precio mínimo, máximo e histograma"""
+    min: Optional[float] = None
+    max: Optional[float] = None
+    histograma: List[PrecioRango] = []
+
+
+class ProductoFacetsResponse(BaseModel):
+    """Conteos y rangos para los filtros del catálogo"""
+    total: int
+    disponibles: int
+    no_disponibles: int
+    categorias: List[CategoriaFacet]
+    precio: PrecioFacet
+
+
+class PedidoCliente(BaseModel):
+    """Datos de contacto del cliente de un pedido"""
+    nombre: str = Field(..., min_length=2, max_length=200)
+    telefono: str = Field(..., min_length=7, max_length=50)
+    direccion: str = Field(..., min_length=5, max_length=500)
+    email: Optional[str] = Field(None, max_length=200)
+    
+    @field_validator("nombre", "telefono", "direccion", "email", mode="before")
+    @classmethod
+    def recortar(cls, value):
+        return value.strip() if isinstance(value, str) else value
+
+
+class PedidoProducto(BaseModel):
+    """Producto dentro de un pedido"""
+    id: Optional[Union[int, str]] = None
+    nombre: str = Field(..., min_length=1, max_length=200)
+    precio: float = Field(..., gt=0)
+    cantidad: int = Field(1, ge=1)
+    descripcion: Optional[str] = ""
+    tipo: Optional[str] = "producto"
+    emoji: Optional[str] = "🛍️"
+    personalizacion: Optional[dict] = None
+
+
+class PedidoCreate(BaseModel):
+    """Schema para crear un Pedido"""
+    cliente: PedidoCliente
+    productos: List[PedidoProducto] = Field(..., min_length=1)
+    total: float = Field(..., gt=0)
+    observaciones: Optional[str] = Field("", max_length=2000)
+
+
+class PedidoResponse(PedidoCreate):
+    """Schema para respuesta de Pedido (también es el cuerpo que recibe n8n)"""
+    id: int
+    estado: str = "pendiente"
+    fecha: Optional[datetime] = None
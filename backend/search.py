@@ -0,0 +1,140 @@
+"""
+Búsqueda de texto completo sobre productos
+
+SQLite usa una tabla virtual FTS5 sincronizada con triggers; PostgreSQL
+usa un índice GIN sobre `tsvector`. En ambos casos la búsqueda ignora
+tildes y ordena por relevancia (el nombre pesa más que la descripción).
+"""
+import re
+from typing import List, Optional
+from sqlalchemy import text
+
+# Documento indexado en PostgreSQL (debe coincidir con el del índice)
+PG_DOCUMENTO = (
+    "setweight(to_tsvector('simple', f_unaccent(coalesce(nombre, ''))), 'A') || "
+    "setweight(to_tsvector('simple', f_unaccent(coalesce(descripcion, ''))), 'B')"
+)
+
+SQLITE_SETUP = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+        nombre, descripcion,
+        content='productos', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS productos_fts_ai AFTER INSERT ON productos BEGIN
+        INSERT INTO productos_fts(rowid, nombre, descripcion)
+        VALUES (new.id, new.nombre, new.descripcion);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS productos_fts_ad AFTER DELETE ON productos BEGIN
+        INSERT INTO productos_fts(productos_fts, rowid, nombre, descripcion)
+        VALUES ('delete', old.id, old.nombre, old.descripcion);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS productos_fts_au AFTER UPDATE OF nombre, descripcion ON productos BEGIN
+        INSERT INTO productos_fts(productos_fts, rowid, nombre, descripcion)
+        VALUES ('delete', old.id, old.nombre, old.descripcion);
+        INSERT INTO productos_fts(rowid, nombre, descripcion)
+        VALUES (new.id, new.nombre, new.descripcion);
+    END
+    """,
+    # Indexar los productos que ya existían
+    "INSERT INTO productos_fts(productos_fts) VALUES ('rebuild')",
+]
+
+
+def crear_indice_busqueda(conn):
+    """Índice de búsqueda de texto completo"""
+    dialect = conn.dialect.name
+
+    if dialect == "sqlite":
+        for sql in SQLITE_SETUP:
+            conn.execute(text(sql))
+
+    elif dialect == "postgresql":
+        # unaccent puede no estar disponible (permisos); sin él la
+        # búsqueda sigue funcionando pero distingue tildes
+        try:
+            with conn.begin_nested():
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+            unaccent = "SELECT public.unaccent('public.unaccent', $1)"
+        except Exception as e:
+            print(f"⚠️ Extensión unaccent no disponible: {e}")
+            unaccent = "SELECT $1"
+
+        conn.execute(text(
+            "CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text AS "
+            f"$$ {unaccent} $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_productos_busqueda "
+            f"ON productos USING GIN (({PG_DOCUMENTO}))"
+        ))
+
+
+def _terminos(q: str) -> List[str]:
+    """Separa la consulta en palabras (sin operadores del motor)"""
+    return re.findall(r"\w+", q.lower())
+
+
+async def buscar_ids(
+    db,
+    q: str,
+    categoria: Optional[str] = None,
+    disponible: Optional[int] = None,
+    limit: int = 20
+) -> List[int]:
+    """
+    Retorna los ids de los productos que coinciden con `q`, ordenados
+    por relevancia. Cada término se busca como prefijo ("tor" => "torta").
+    """
+    terminos = _terminos(q)
+    if not terminos:
+        return []
+
+    dialect = db.bind.dialect.name
+    params = {"limit": limit}
+    filtros = ""
+    if categoria:
+        filtros += " AND p.categoria = :categoria"
+        params["categoria"] = categoria
+    if disponible is not None:
+        filtros += " AND p.disponible = :disponible"
+        params["disponible"] = disponible
+
+    if dialect == "sqlite":
+        params["q"] = " ".join(f'"{t}"*' for t in terminos)
+        sql = (
+            "SELECT p.id FROM productos_fts "
+            "JOIN productos p ON p.id = productos_fts.rowid "
+            f"WHERE productos_fts MATCH :q{filtros} "
+            "ORDER BY bm25(productos_fts, 10.0, 1.0), p.id LIMIT :limit"
+        )
+    elif dialect == "postgresql":
+        params["q"] = " & ".join(f"{t}:*" for t in terminos)
+        sql = (
+            "SELECT p.id FROM productos p, "
+            "to_tsquery('simple', f_unaccent(:q)) AS consulta "
+            f"WHERE ({PG_DOCUMENTO}) @@ consulta{filtros} "
+            f"ORDER BY ts_rank(({PG_DOCUMENTO}), consulta) DESC, p.id LIMIT :limit"
+        )
+    else:
+        # Otros motores: coincidencia simple sin índice ni ranking
+        condiciones = []
+        for i, termino in enumerate(terminos):
+            params[f"t{i}"] = f"%{termino}%"
+            condiciones.append(
+                f"(lower(p.nombre) LIKE :t{i} OR lower(coalesce(p.descripcion, '')) LIKE :t{i})"
+            )
+        sql = (
+            f"SELECT p.id FROM productos p WHERE {' AND '.join(condiciones)}{filtros} "
+            "ORDER BY p.id LIMIT :limit"
+        )
+
+    result = await db.execute(text(sql), params)
+    return [row[0] for row in result]
@@ -0,0 +1,243 @@
+"""
+Exporta el catálogo a archivos JSON estáticos para servirlos desde un CDN
+
+Genera un archivo por categoría (con el mismo formato que
+`GET /productos/?categoria=...`) y un manifiesto `index.json` con el
+hash de cada archivo. Los nombres de los archivos incluyen su hash, así
+que se pueden cachear indefinidamente; solo `index.json` cambia.
+Cada archivo se acompaña de copias comprimidas `.gz` y, si el paquete
+`brotli` está instalado, `.br`.
+
+Uso:
+    python static_export.py                              # en STATIC_EXPORT_PATH
+    python static_export.py --destino ../public/catalogo
+
+Con STATIC_EXPORT_ON_WRITE=true la API vuelve a exportar después de
+cada cambio del catálogo (agrupando los cambios de STATIC_EXPORT_DELAY
+segundos).
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import asyncio
+import hashlib
+import unicodedata
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import select
+from database import AsyncSessionLocal
+from models import Producto
+from cache import catalog_cache
+from fragments import COLUMNAS_VERSION, fragmentos_por_id, lista_json
+
+# Configuración
+STATIC_EXPORT_PATH = os.getenv("STATIC_EXPORT_PATH", "../public/catalogo")
+STATIC_EXPORT_ON_WRITE = os.getenv("STATIC_EXPORT_ON_WRITE", "false").lower() == "true"
+STATIC_EXPORT_DELAY = float(os.getenv("STATIC_EXPORT_DELAY", "5"))
+
+MANIFEST = "index.json"
+FORMATO = 1
+# Productos cargados por consulta al generar fragmentos
+LOTE = 500
+
+
+def _slug(categoria: str) -> str:
+    """Nombre de archivo seguro para una categoría ("Días Especiales" => "dias-especiales")"""
+    texto = unicodedata.normalize("NFKD", categoria).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "-", texto.lower()).strip("-") or "categoria"
+
+
+def _comprimidos(data: bytes) -> Dict[str, bytes]:
+    """Copias pre-comprimidas por extensión (brotli es opcional)"""
+    copias = {"gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        return copias
+    copias["br"] = brotli.compress(data, quality=11)
+    return copias
+
+
+def _escribir(ruta: str, data: bytes) -> None:
+    """Escritura atómica: nunca se sirve un archivo a medio escribir"""
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb") as f:
+        f.write(data)
+    os.replace(temporal, ruta)
+
+
+def _archivos_del_manifiesto(destino: str) -> set:
+    """Archivos referenciados por el manifiesto actual (si existe)"""
+    try:
+        with open(os.path.join(destino, MANIFEST), encoding="utf-8") as f:
+            manifiesto = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    archivos = set()
+    for shard in manifiesto.get("categorias", []):
+        archivos.add(shard["archivo"])
+        archivos.update(f"{shard['archivo']}.{ext}" for ext in shard.get("comprimidos", []))
+    return archivos
+
+
+async def leer_catalogo(db) -> Dict[str, List[bytes]]:
+    """Fragmentos JSON de todos los productos agrupados por categoría (orden por id)"""
+    result = await db.execute(
+        select(*COLUMNAS_VERSION, Producto.categoria).order_by(Producto.id)
+    )
+    filas = result.all()
+
+    catalogo: Dict[str, List[bytes]] = {}
+    for inicio in range(0, len(filas), LOTE):
+        lote = filas[inicio:inicio + LOTE]
+        fragmentos = await fragmentos_por_id(db, [fila[:3] for fila in lote])
+        for fila in lote:
+            if fila.id in fragmentos:
+                catalogo.setdefault(fila.categoria, []).append(fragmentos[fila.id])
+    return catalogo
+
+
+def escribir_shards(destino: str, catalogo: Dict[str, List[bytes]]) -> dict:
+    """
+    Escribe un archivo por categoría y el manifiesto. Los archivos de
+    la exportación anterior se conservan hasta la siguiente, para los
+    clientes que aún tienen el manifiesto viejo.
+    """
+    os.makedirs(destino, exist_ok=True)
+    anteriores = _archivos_del_manifiesto(destino)
+
+    shards = []
+    usados = set()
+    nombres = set()
+    for categoria in sorted(catalogo):
+        fragmentos = catalogo[categoria]
+        cuerpo = lista_json(len(fragmentos), fragmentos)
+        sha256 = hashlib.sha256(cuerpo).hexdigest()
+
+        slug = _slug(categoria)
+        base, n = slug, 2
+        while slug in nombres:
+            slug, n = f"{base}-{n}", n + 1
+        nombres.add(slug)
+
+        archivo = f"{slug}.{sha256[:12]}.json"
+        _escribir(os.path.join(destino, archivo), cuerpo)
+        usados.add(archivo)
+        copias = _comprimidos(cuerpo)
+        for ext, data in copias.items():
+            _escribir(os.path.join(destino, f"{archivo}.{ext}"), data)
+            usados.add(f"{archivo}.{ext}")
+
+        shards.append({
+            "categoria": categoria,
+            "archivo": archivo,
+            "productos": len(fragmentos),
+            "bytes": len(cuerpo),
+            "sha256": sha256,
+            "comprimidos": sorted(copias),
+        })
+
+    manifiesto = {
+        "formato": FORMATO,
+        "generado": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "total": sum(shard["productos"] for shard in shards),
+        "categorias": shards,
+    }
+    cuerpo = json.dumps(manifiesto, ensure_ascii=False, separators=(",", ":")).encode()
+    for ext, data in _comprimidos(cuerpo).items():
+        _escribir(os.path.join(destino, f"{MANIFEST}.{ext}"), data)
+    # El manifiesto se escribe al final: apunta solo a archivos ya escritos
+    _escribir(os.path.join(destino, MANIFEST), cuerpo)
+
+    # Eliminar archivos de exportaciones más antiguas
+    conservar = usados | anteriores
+    for nombre in os.listdir(destino):
+        if nombre.startswith("index.json"):
+            continue
+        if re.search(r"\.[0-9a-f]{12}\.json(\.gz|\.br)?$", nombre) and nombre not in conservar:
+            os.remove(os.path.join(destino, nombre))
+
+    return manifiesto
+
+
+class StaticExporter:
+    """
+    Exportación del catálogo, también programable después de cada
+    escritura (los cambios cercanos se agrupan en una sola exportación)
+    """
+
+    def __init__(self, destino: str = STATIC_EXPORT_PATH, delay: float = STATIC_EXPORT_DELAY):
+        self.destino = destino
+        self.delay = delay
+        self.exportaciones = 0
+        self._lock = asyncio.Lock()
+        self._sucio = False
+        self._tarea: Optional[asyncio.Task] = None
+        self._cerrando = asyncio.Event()  # corta la espera de `delay` al cerrar
+
+    async def exportar(self) -> dict:
+        """Lee el catálogo desde la base primaria y escribe los archivos"""
+        async with self._lock:
+            async with AsyncSessionLocal() as db:
+                catalogo = await leer_catalogo(db)
+            manifiesto = await asyncio.to_thread(escribir_shards, self.destino, catalogo)
+            self.exportaciones += 1
+            return manifiesto
+
+    def programar(self) -> None:
+        """Marca el catálogo como modificado (listener de catalog_cache)"""
+        self._sucio = True
+        if self._tarea is not None and not self._tarea.done():
+            return
+        try:
+            self._tarea = asyncio.get_running_loop().create_task(self._exportar_pendientes())
+        except RuntimeError:
+            # Sin event loop (scripts): no hay exportación automática
+            pass
+
+    async def _exportar_pendientes(self):
+        while self._sucio:
+            try:
+                await asyncio.wait_for(self._cerrando.wait(), self.delay)
+            except asyncio.TimeoutError:
+                pass
+            self._sucio = False
+            try:
+                manifiesto = await self.exportar()
+                print(f"📦 Catálogo estático exportado ({manifiesto['total']} productos)")
+            except Exception as e:
+                print(f"❌ Error exportando el catálogo estático: {e}")
+
+    def start(self) -> None:
+        if STATIC_EXPORT_ON_WRITE:
+            catalog_cache.on_invalidate(self.programar)
+            print(f"✅ Exportación estática del catálogo activada en {self.destino}")
+
+    async def shutdown(self) -> None:
+        """
+        Completa la exportación pendiente antes de cerrar. La tarea no se
+        cancela: una exportación a medias se termina y una programada se
+        hace sin esperar `delay`.
+        """
+        self._cerrando.set()
+        if self._tarea is not None:
+            await self._tarea
+
+
+static_exporter = StaticExporter()
+
+
+async def main(destino: str):
+    from database import init_db
+    await init_db()
+    manifiesto = await StaticExporter(destino).exportar()
+    print(f"✅ {manifiesto['total']} productos exportados en {len(manifiesto['categorias'])} archivo(s) en {destino}")
+
+
+if __name__ == "__main__":
+    destino = STATIC_EXPORT_PATH
+    if "--destino" in sys.argv:
+        destino = sys.argv[sys.argv.index("--destino") + 1]
+    asyncio.run(main(destino))
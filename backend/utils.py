@@ -3,129 +3,386 @@ Utilidades para manejo de archivos y otros
 """
 import os
 import uuid
+import asyncio
+import hashlib
 from pathlib import Path
-from typing import List
+from functools import lru_cache
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Tuple
 from fastapi import UploadFile, HTTPException
-from PIL import Image
+from fastapi.concurrency import run_in_threadpool
 import shutil
+from image_pipeline import image_pipeline, IMAGE_QUEUE_TIMEOUT
+from metrics import image_bytes_saved
 
 # Configuración
 MEDIA_PATH = os.getenv("MEDIA_PATH", "./media")
 MAX_IMAGE_SIZE_MB = int(os.getenv("MAX_IMAGE_SIZE_MB", "5"))
 ALLOWED_EXTENSIONS = os.getenv("ALLOWED_IMAGE_EXTENSIONS", "jpg,jpeg,png,webp").split(",")
+# Subdirectorio de productos/ para los archivos direccionados por contenido
+CONTENT_DIR = "sha256"
+PENDING_SUFFIX = ".pendiente"
+# Variantes responsivas: anchos en px y formatos extra (además del original)
+IMAGE_VARIANT_WIDTHS = sorted(int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "200,480,1200").split(",") if w.strip())
+IMAGE_VARIANT_FORMATS = [
+    f.strip().lower() for f in os.getenv("IMAGE_VARIANT_FORMATS", "webp").split(",") if f.strip()
+]
 
+# PIL se importa solo donde se procesan imágenes (pool de procesos)
+if TYPE_CHECKING:
+    from PIL import Image
 
-def ensure_media_dir(producto_id: int) -> Path:
+# Lectura por bloques de las subidas
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Firmas (magic bytes) de los formatos aceptados => extensión
+MAGIC_BYTES = [
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+]
+
+# Opciones de codificación por formato
+SAVE_OPTIONS = {
+    "jpeg": {"quality": 85, "optimize": True, "progressive": True},
+    "png": {"optimize": True},
+    "webp": {"quality": 80, "method": 4},
+    "avif": {"quality": 60},
+}
+
+
+class ImagenInvalida(ValueError):
+    """El archivo tiene la firma de una imagen pero no se puede decodificar"""
+
+
+def validate_image(file: UploadFile) -> None:
     """
-    Asegura que existe el directorio para las imágenes del producto
+    Rechaza de inmediato los archivos cuyo tamaño declarado excede el
+    máximo (el contenido se valida al leerlo en `ingest_upload`)
     """
-    path = Path(MEDIA_PATH) / "productos" / str(producto_id)
-    path.mkdir(parents=True, exist_ok=True)
-    return path
+    if hasattr(file, 'size') and file.size:
+        if file.size > MAX_IMAGE_SIZE_MB * 1024 * 1024:
+            _raise_too_large()
 
 
-def validate_image(file: UploadFile) -> None:
+def _raise_too_large():
+    raise HTTPException(
+        status_code=400,
+        detail=f"La imagen excede el tamaño máximo de {MAX_IMAGE_SIZE_MB}MB"
+    )
+
+
+def sniff_image_format(head: bytes) -> Optional[str]:
     """
-    Valida que el archivo sea una imagen válida
+    Detecta el formato por sus primeros bytes y retorna la extensión
     """
-    # Validar extensión
-    ext = file.filename.split(".")[-1].lower()
-    if ext not in ALLOWED_EXTENSIONS:
+    for magic, ext in MAGIC_BYTES:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def _check_format(head: bytes) -> str:
+    """Valida el formato detectado contra ALLOWED_EXTENSIONS"""
+    ext = sniff_image_format(head)
+    permitidas = set(ALLOWED_EXTENSIONS)
+    if ext == "jpg" and "jpeg" in permitidas:
+        permitidas.add("jpg")
+    if ext is None or ext not in permitidas:
         raise HTTPException(
             status_code=400,
-            detail=f"Extensión no permitida. Usa: {', '.join(ALLOWED_EXTENSIONS)}"
+            detail=f"El archivo no es una imagen permitida. Usa: {', '.join(ALLOWED_EXTENSIONS)}"
         )
-    
-    # Validar tamaño (aproximado)
-    if hasattr(file, 'size') and file.size:
-        max_size = MAX_IMAGE_SIZE_MB * 1024 * 1024
-        if file.size > max_size:
-            raise HTTPException(
-                status_code=400,
-                detail=f"La imagen excede el tamaño máximo de {MAX_IMAGE_SIZE_MB}MB"
-            )
+    return ext
 
 
-async def save_image(file: UploadFile, producto_id: int) -> str:
+async def upload_chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    """Lee un UploadFile por bloques"""
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def ingest_upload(chunks: AsyncIterator[bytes]) -> Tuple[bytes, str, str]:
     """
-    Guarda una imagen y retorna la URL relativa
+    Lee una subida por bloques en memoria y retorna (contenido, extensión, sha256)
+    
+    El formato se valida con los primeros bytes y la lectura se corta en
+    cuanto se supera MAX_IMAGE_SIZE_MB, así un archivo inválido no llega
+    a escribirse en disco.
     """
-    validate_image(file)
+    max_size = MAX_IMAGE_SIZE_MB * 1024 * 1024
+    buffer = bytearray()
+    digest = hashlib.sha256()
+    ext = None
+    
+    async for chunk in chunks:
+        buffer += chunk
+        if len(buffer) > max_size:
+            _raise_too_large()
+        digest.update(chunk)
+        if ext is None and len(buffer) >= 12:
+            ext = _check_format(bytes(buffer[:12]))
+    
+    if ext is None:
+        ext = _check_format(bytes(buffer))
     
-    # Generar nombre único
-    ext = file.filename.split(".")[-1].lower()
-    filename = f"{uuid.uuid4()}.{ext}"
+    return bytes(buffer), ext, digest.hexdigest()
+
+
+def image_path_from_url(image_url: str) -> Path:
+    """
+    Convierte una URL relativa (/media/...) en la ruta del archivo
+    """
+    return Path(MEDIA_PATH) / image_url.replace("/media/", "", 1)
+
+
+def _write_file(data: bytes, file_path: Path) -> None:
+    """
+    Escribe el contenido en disco de forma atómica (se ejecuta en un hilo)
+    """
+    tmp_path = file_path.with_name(f".{uuid.uuid4().hex}.part")
+    with open(tmp_path, "wb") as buffer:
+        buffer.write(data)
+    os.replace(tmp_path, file_path)
+
+
+def content_url(content_hash: str, ext: str) -> str:
+    """
+    URL direccionada por contenido: el mismo archivo siempre queda en la
+    misma ruta (/media/productos/sha256/ab/abcd....jpg)
+    """
+    return f"/media/productos/{CONTENT_DIR}/{content_hash[:2]}/{content_hash}.{ext}"
+
+
+def pending_url(content_hash: str, ext: str) -> str:
+    """
+    URL del original sin procesar; al terminar de procesarse la imagen
+    pasa a `content_url`, así una URL direccionada por contenido nunca
+    cambia de contenido y puede cachearse como inmutable
+    """
+    return f"/media/productos/{CONTENT_DIR}/{content_hash[:2]}/{content_hash}{PENDING_SUFFIX}.{ext}"
+
+
+# Evita procesar dos veces a la vez el mismo contenido: hash => [lock, usuarios]
+_content_locks: Dict[str, list] = {}
+
+
+async def store_image(data: bytes, ext: str, content_hash: str, optimize: bool = True) -> dict:
+    """
+    Guarda una imagen ya leída con `ingest_upload` y retorna
+    {"url", "variantes", "hash", "size"}
     
-    # Crear directorio si no existe
-    dir_path = ensure_media_dir(producto_id)
-    file_path = dir_path / filename
+    La escritura y la optimización se hacen fuera del event loop. Con
+    `optimize=False` solo se guarda el original (sin variantes) en su URL
+    pendiente; el llamador debe procesarlo después con `finalize_pending_image`.
+    """
+    url_imagen = content_url(content_hash, ext) if optimize else pending_url(content_hash, ext)
+    file_path = image_path_from_url(url_imagen)
     
-    # Guardar archivo
+    entry = _content_locks.setdefault(content_hash, [asyncio.Lock(), 0])
+    entry[1] += 1
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Optimizar imagen
-        optimize_image(file_path)
+        async with entry[0]:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            await run_in_threadpool(_write_file, data, file_path)
+            
+            # Optimizar imagen y generar variantes en el pool de procesos
+            variantes = []
+            if optimize:
+                variantes = await process_image_url(url_imagen)
         
-        # Retornar URL relativa
-        return f"/media/productos/{producto_id}/{filename}"
+        return {
+            "url": url_imagen,
+            "variantes": variantes,
+            "hash": content_hash,
+            "size": len(data),
+        }
+    
+    except HTTPException:
+        delete_image(url_imagen)
+        raise
+    
+    except ImagenInvalida as e:
+        delete_image(url_imagen)
+        raise HTTPException(status_code=400, detail=str(e))
     
     except Exception as e:
         # Limpiar archivo si hay error
-        if file_path.exists():
-            file_path.unlink()
+        delete_image(url_imagen)
         raise HTTPException(status_code=500, detail=f"Error guardando imagen: {str(e)}")
     
     finally:
-        file.file.close()
+        entry[1] -= 1
+        if entry[1] == 0:
+            _content_locks.pop(content_hash, None)
+
+
+async def process_image_url(
+    image_url: str,
+    optimize_original: bool = True,
+    timeout: Optional[float] = IMAGE_QUEUE_TIMEOUT,
+    dest_url: Optional[str] = None
+) -> List[dict]:
+    """
+    Procesa en el pool una imagen ya guardada y retorna sus variantes
+    como [{"ancho": 200, "formato": "webp", "url": "/media/..."}, ...]
+    
+    Con `dest_url` el original optimizado y las variantes se escriben
+    junto a esa URL en lugar de la de origen.
+    """
+    dest_url = dest_url or image_url
+    origen, destino = image_path_from_url(image_url), image_path_from_url(dest_url)
+    tamano_original = origen.stat().st_size if origen.exists() else 0
+    generadas = await image_pipeline.run(
+        process_image,
+        origen,
+        optimize_original,
+        1200,
+        destino,
+        timeout=timeout
+    )
+    if tamano_original and destino.exists():
+        image_bytes_saved.inc(amount=max(tamano_original - destino.stat().st_size, 0))
+    base_url = dest_url.rsplit("/", 1)[0]
+    return [
+        {"ancho": v["ancho"], "formato": v["formato"], "url": f"{base_url}/{v['archivo']}"}
+        for v in generadas
+    ]
+
+
+async def finalize_pending_image(image_url: str) -> dict:
+    """
+    Procesa una imagen guardada con `optimize=False`, la mueve a su URL
+    definitiva y retorna {"url", "variantes"}
+    """
+    final_url = image_url.replace(PENDING_SUFFIX, "", 1)
+    variantes = await process_image_url(image_url, timeout=None, dest_url=final_url)
+    if not image_path_from_url(final_url).exists():
+        raise RuntimeError("No se pudo procesar la imagen")
+    delete_image(image_url)
+    return {"url": final_url, "variantes": variantes}
+
+
+@lru_cache(maxsize=None)
+def _variant_formats() -> Tuple[str, ...]:
+    """Formatos de IMAGE_VARIANT_FORMATS que esta instalación de Pillow soporta"""
+    from PIL import features
+    return tuple(f for f in IMAGE_VARIANT_FORMATS if features.check(f))
+
+
+def _to_rgb(img: "Image.Image") -> "Image.Image":
+    """Convierte a RGB usando fondo blanco para la transparencia"""
+    from PIL import Image
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+        return background
+    return img
+
 
+def _resize(img: "Image.Image", max_width: int) -> "Image.Image":
+    """Reduce la imagen a `max_width` manteniendo la proporción"""
+    from PIL import Image
+    if img.width <= max_width:
+        return img
+    ratio = max_width / img.width
+    new_size = (max_width, int(img.height * ratio))
+    return img.resize(new_size, Image.Resampling.LANCZOS)
 
-def optimize_image(image_path: Path, max_width: int = 1200):
+
+def _variant_widths(width: int) -> List[int]:
+    """
+    Anchos a generar: los configurados menores que la imagen y un último
+    tamaño "completo" (el ancho original si es menor que el máximo)
+    """
+    if not IMAGE_VARIANT_WIDTHS:
+        return []
+    full = min(width, IMAGE_VARIANT_WIDTHS[-1])
+    return [w for w in IMAGE_VARIANT_WIDTHS if w < full] + [full]
+
+
+def _format_name(ext: str) -> str:
+    return "jpeg" if ext in ("jpg", "jpeg") else ext
+
+
+def process_image(
+    image_path: Path,
+    optimize_original: bool = True,
+    max_width: int = 1200,
+    dest_path: Optional[Path] = None
+) -> List[dict]:
     """
-    Optimiza una imagen reduciendo su tamaño si es necesario
+    Genera las variantes por ancho (formatos extra + formato original) y
+    optimiza el original decodificando la imagen una sola vez.
+    Se ejecuta en el pool de procesos; retorna nombres de archivo.
+    Lanza `ImagenInvalida` si el archivo no se puede decodificar.
     """
+    from PIL import Image
+    dest_path = dest_path or image_path
+    variantes = []
     try:
-        with Image.open(image_path) as img:
-            # Convertir a RGB si es necesario
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            
-            # Redimensionar si es muy grande
-            if img.width > max_width:
-                ratio = max_width / img.width
-                new_size = (max_width, int(img.height * ratio))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-            
-            # Guardar optimizado
-            img.save(image_path, optimize=True, quality=85)
-    
+        original = Image.open(image_path)
+        original.load()
     except Exception as e:
-        print(f"Error optimizando imagen: {e}")
+        # El detalle de PIL incluye la ruta del archivo: solo va al log
+        print(f"❌ No se pudo decodificar {image_path}: {e}")
+        raise ImagenInvalida("La imagen está dañada o no se puede leer") from None
+    
+    with original:
+        img = _to_rgb(original)
+        ext = dest_path.suffix.lstrip(".").lower()
+        formatos = list(dict.fromkeys(_variant_formats() + (_format_name(ext),)))
+        
+        for ancho in _variant_widths(img.width):
+            resized = _resize(img, ancho)
+            for formato in formatos:
+                archivo = f"{dest_path.stem}_w{ancho}.{ext if formato == _format_name(ext) else formato}"
+                resized.save(dest_path.with_name(archivo), **SAVE_OPTIONS.get(formato, {}))
+                variantes.append({"ancho": ancho, "formato": formato, "archivo": archivo})
+        
+        if optimize_original or dest_path != image_path:
+            _resize(img, max_width).save(dest_path, optimize=True, quality=85)
+    
+    return variantes
 
 
 def delete_product_images(producto_id: int):
     """
-    Elimina todas las imágenes de un producto
+    Elimina el directorio de imágenes de un producto (formato anterior,
+    /media/productos/{id}/); los archivos direccionados por contenido se
+    eliminan con `delete_image` cuando ya no tienen referencias
     """
     dir_path = Path(MEDIA_PATH) / "productos" / str(producto_id)
     if dir_path.exists():
         shutil.rmtree(dir_path)
 
 
+def touch_image(image_url: str):
+    """
+    Marca una imagen como recién usada (mtime) para que la limpieza en
+    segundo plano no la borre mientras su nuevo registro no hace commit
+    """
+    try:
+        os.utime(image_path_from_url(image_url))
+    except OSError:
+        pass
+
+
 def delete_image(image_url: str):
     """
-    Elimina una imagen específica
+    Elimina una imagen específica y sus variantes
     """
     try:
         # Convertir URL a path
-        image_path = Path(MEDIA_PATH) / image_url.replace("/media/", "")
+        image_path = image_path_from_url(image_url)
         if image_path.exists():
             image_path.unlink()
+        for variante in image_path.parent.glob(f"{image_path.stem}_w*.*"):
+            variante.unlink()
     except Exception as e:
         print(f"Error eliminando imagen: {e}")
-